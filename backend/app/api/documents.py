@@ -1,8 +1,12 @@
 import os
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from app.config import SessionLocal
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import AsyncSessionLocal
 from app.models.document import Document
 from app.services.document_service import DocumentService
 
@@ -11,39 +15,87 @@ logging.basicConfig(level=logging.INFO)
     
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
+CACHE_CONTROL = "private, max-age=10"
+
+def remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+        logger.info(f"Deleted file: {path}")
+
+def remove_files(paths: List[str]):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(remove_file, paths))
+
+async def discard_files(paths: List[str]):
     try:
+        await run_in_threadpool(remove_files, paths)
+    except OSError as e:
+        logger.warning(f"Could not remove document files: {str(e)}")
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def is_not_modified(request: Request, response: Response, etag: str) -> bool:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
 
 @router.get("/documents")
-def list_documents(
+async def list_documents(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    after_id: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_db)
 ):
     document_service = DocumentService(db)
-    return document_service.get_documents(page, page_size)
+    etag = await document_service.get_version()
+    if is_not_modified(request, response, etag):
+        return not_modified_response(etag)
+    return await document_service.get_documents(page, page_size, after_id)
 
 @router.get("/documents/{document_id}")
-def get_document(document_id: int, db: Session = Depends(get_db)):
+async def get_document(
+    document_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
     document_service = DocumentService(db)
-    document = document_service.get_document(document_id)
+    etag = await document_service.get_version(document_id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if is_not_modified(request, response, etag):
+        return not_modified_response(etag)
+    document = await document_service.get_document(document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     return document
 
 @router.get("/documents/{document_id}/chunks/{chunk_index}")
-def get_document_chunk(
+async def get_document_chunk(
     document_id: int,
     chunk_index: int,
+    request: Request,
+    response: Response,
     chunk_size: int = Query(5000, ge=100, le=10000),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     document_service = DocumentService(db)
-    chunk = document_service.get_document_chunk(document_id, chunk_index, chunk_size)
+    etag = await document_service.get_version(document_id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Document or chunk not found")
+    if is_not_modified(request, response, etag):
+        return not_modified_response(etag)
+    chunk = await document_service.get_document_chunk(document_id, chunk_index, chunk_size)
     if not chunk:
         raise HTTPException(status_code=404, detail="Document or chunk not found")
     return chunk
@@ -51,10 +103,10 @@ def get_document_chunk(
 @router.post("/documents/batch")
 async def batch_process_documents(
     batch: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     document_service = DocumentService(db)
-    result = document_service.batch_process_documents(
+    result = await document_service.batch_process_documents(
         batch.get("document_ids", []),
         batch.get("operation", ""),
         batch.get("params", {})
@@ -65,37 +117,32 @@ async def batch_process_documents(
     return result
 
 @router.delete("/documents/{document_id}")
-def delete_document(document_id: int, db: Session = Depends(get_db)):
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
+async def delete_document(document_id: int, db: AsyncSession = Depends(get_db)):
+    file_path = await db.scalar(
+        delete(Document).where(Document.id == document_id).returning(Document.content_path)
+    )
+    if file_path is None:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    file_path = document.content_path
 
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Deleted file: {file_path}")
-        
-        db.delete(document)
-        db.commit()
-        return {"message": "Document deleted successfully"}
+        await db.commit()
     except Exception as e:
         logger.error(f"Error deleting document: {str(e)}")
         raise HTTPException(status_code=500, detail="Error deleting document")
 
+    # Files go only once the delete is committed: a leftover file is a harmless orphan,
+    # a row pointing at a missing file is not
+    await discard_files([file_path])
+    return {"message": "Document deleted successfully"}
+
 @router.delete("/documents")
-def delete_all_documents(db: Session = Depends(get_db)):
+async def delete_all_documents(db: AsyncSession = Depends(get_db)):
     try:
-        documents = db.query(Document).all()
-        for document in documents:
-            if os.path.exists(document.content_path):
-                os.remove(document.content_path)
-                logger.info(f"Deleted file: {document.content_path}")
-        
-        db.query(Document).delete()
-        db.commit()
-        return {"message": "All documents deleted successfully"}
+        paths = (await db.scalars(delete(Document).returning(Document.content_path))).all()
+        await db.commit()
     except Exception as e:
         logger.error(f"Error deleting all documents: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error deleting documents")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error deleting documents")
+
+    await discard_files(paths)
+    return {"message": "All documents deleted successfully"}
\ No newline at end of file
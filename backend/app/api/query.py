@@ -1,11 +1,13 @@
+import asyncio
 import logging
 from pydantic import BaseModel
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException, Body
 from app.services.vectorstore.query_processor import process_query
 from app.services.theme_identification import identify_themes
-from app.config import SessionLocal
+from app.config import AsyncSessionLocal
 from app.models.document import Document
 
 logger = logging.getLogger(__name__)
@@ -22,46 +24,44 @@ class QueryRequest(BaseModel):
     advanced_mode: bool = False
     citation_level: str = "paragraph"
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 @router.post("/query")
 async def query_documents(
     request: QueryRequest = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     
     try:
-        selected_docs = None
+        selected_ids = None
         if request.document_ids:
-            selected_docs = db.query(Document).filter(Document.id.in_(request.document_ids)).all()
-            if len(selected_docs) != len(request.document_ids):
-                found_ids = [doc.id for doc in selected_docs]
-                missing_ids = [id for id in request.document_ids if id not in found_ids]
-                logger.warning(f"Some document IDs not found: {missing_ids}")
+            requested_ids = set(request.document_ids)
+            selected_ids = (await db.scalars(select(Document.id).where(Document.id.in_(requested_ids)))).all()
+            missing_ids = requested_ids.difference(selected_ids)
+            if missing_ids:
+                logger.warning(f"Some document IDs not found: {sorted(missing_ids)}")
         
         logger.info(f"Processing query: '{request.query}'")
         logger.info(f"Parameters: enable_themes={request.enable_themes}, theme_count={request.theme_count}, " 
                    f"relevance_threshold={request.relevance_threshold}, advanced_mode={request.advanced_mode}, citation_level={request.citation_level}")
-        if selected_docs:
-            logger.info(f"Selected document IDs: {[doc.id for doc in selected_docs]}")
+        if selected_ids:
+            logger.info(f"Selected document IDs: {selected_ids}")
         
-        matches = process_query(
+        matches = await process_query(
             request.query, 
-            document_ids=[doc.id for doc in selected_docs] if selected_docs else None,
+            document_ids=list(selected_ids) if selected_ids else None,
             relevance_threshold=request.relevance_threshold,
             advanced_mode=request.advanced_mode,
-            citation_level=request.citation_level
+            citation_level=request.citation_level,
+            db=db
         )
         
         themes = None
         if request.enable_themes and matches:
             try:
-                themes = identify_themes(matches, theme_count=request.theme_count)
+                themes = await asyncio.to_thread(identify_themes, matches, theme_count=request.theme_count)
             except Exception as e:
                 logger.error(f"Error in theme identification: {str(e)}")
                 themes = []
@@ -76,7 +76,7 @@ async def query_documents(
                 "relevance_threshold": request.relevance_threshold,
                 "advanced_mode": request.advanced_mode,
                 "citation_level": request.citation_level,
-                "selected_document_count": len(selected_docs) if selected_docs else None
+                "selected_document_count": len(selected_ids) if selected_ids else None
             }
         }
         
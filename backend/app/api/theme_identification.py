@@ -1,5 +1,7 @@
 import re
 import logging
+import threading
+import orjson
 from typing import List, Dict, Any, Literal
 import google.generativeai as genai
 from collections import defaultdict
@@ -17,12 +19,11 @@ genai.model_name = settings.MODEL_NAME
 
 router = APIRouter()
 
+_WS_RE = re.compile(r'\s+')
+
 def get_db():
-    db = SessionLocal()
-    try:
+    with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 class ThemeIdentifier:
     def __init__(self, model_name: str = settings.MODEL_NAME):
@@ -55,8 +56,7 @@ class ThemeIdentifier:
         return themes
     
     def _prepare_context(self, query_results: List[Dict[str, Any]], original_query: str) -> str:
-        context = f"QUERY: {original_query}\n\n"
-        context += "DOCUMENT EXCERPTS:\n\n"
+        parts = [f"QUERY: {original_query}\n\n", "DOCUMENT EXCERPTS:\n\n"]
         
         grouped_results = defaultdict(list)
         for result in query_results:
@@ -64,12 +64,12 @@ class ThemeIdentifier:
         
         for i, (filename, texts) in enumerate(grouped_results.items()):
             doc_id = f"DOC{i+1:03d}"
-            context += f"--- {doc_id} ({filename}) ---\n"
+            parts.append(f"--- {doc_id} ({filename}) ---\n")
             for text in texts:
-                clean_text = re.sub(r'\s+', ' ', text).strip()
-                context += f"{clean_text}\n\n"
+                parts.append(_WS_RE.sub(' ', text).strip())
+                parts.append("\n\n")
         
-        return context
+        return "".join(parts)
     
     def _generate_themes(self, context: str) -> Dict:
         logger.info("Generating themes using Gemini")
@@ -114,15 +114,19 @@ class ThemeIdentifier:
             response_text = response.text
             logger.debug(f"Raw response: {response_text[:200]}...")
             
-            response_text = re.sub(r'^```json\s*|\s*```$', '', response_text.strip())
-            response_text = re.sub(r'^```\s*|\s*```$', '', response_text.strip())
+            response_text = (
+                response_text.strip()
+                .removeprefix("```json")
+                .removeprefix("```")
+                .removesuffix("```")
+                .strip()
+            )
             
-            import json
             try:
-                themes = json.loads(response_text)
+                themes = orjson.loads(response_text)
                 logger.info(f"Successfully parsed JSON with {len(themes.get('themes', []))} themes")
                 return themes
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.error(f"JSON parsing error: {str(e)}")
                 return {
                     "themes": [],
@@ -137,10 +141,20 @@ class ThemeIdentifier:
                 "error": f"Error generating themes: {str(e)}"
             }
 
+_IDENTIFIER = None
+_IDENTIFIER_LOCK = threading.Lock()
+
+def _get_identifier() -> ThemeIdentifier:
+    global _IDENTIFIER
+    if _IDENTIFIER is None:
+        with _IDENTIFIER_LOCK:
+            if _IDENTIFIER is None:
+                _IDENTIFIER = ThemeIdentifier()
+    return _IDENTIFIER
+
 def identify_themes(query_results: List[Dict[str, Any]], original_query: str) -> Dict:
     logger.info(f"identify_themes called with query: {original_query} and {len(query_results)} results")
-    theme_identifier = ThemeIdentifier()
-    return theme_identifier.identify_themes(query_results, original_query)
+    return _get_identifier().identify_themes(query_results, original_query)
 
 @router.get("/themes/{theme_id}/citations")
 async def get_citations_for_theme(
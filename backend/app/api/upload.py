@@ -1,11 +1,10 @@
-import os
-import asyncio
 import logging
-from sqlalchemy.orm import Session
-from app.config import SessionLocal
+import threading
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import AsyncSessionLocal, SessionLocal, settings
 from app.models.document import Document
 from app.services.vectorstore.document_indexing import build_vector_store
-from app.services.ocr import extract_text_from_pdf, extract_text_from_image, save_text_to_file
+from app.services.ocr import extract_text_from_pdf, extract_text_from_image, save_text_to_file, get_text_path
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, BackgroundTasks
 
 
@@ -14,12 +13,15 @@ logging.basicConfig(level=logging.INFO)
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
+REBUILD_DEBOUNCE_SECONDS = 5.0
+
+_REBUILD_LOCK = threading.Lock()
+_REBUILD_RUN_LOCK = threading.Lock()
+_REBUILD_TIMER = None
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def rebuild_vector_store_task():
     try:
@@ -32,11 +34,54 @@ def rebuild_vector_store_task():
     except Exception as e:
         logger.error(f"Error rebuilding vector store: {str(e)}")
 
+def _run_scheduled_rebuild():
+    global _REBUILD_TIMER
+    with _REBUILD_LOCK:
+        _REBUILD_TIMER = None
+    # Serialize rebuilds so a late timer never overlaps a running build
+    with _REBUILD_RUN_LOCK:
+        rebuild_vector_store_task()
+
+def schedule_vector_store_rebuild(delay: float = REBUILD_DEBOUNCE_SECONDS):
+    """Coalesce bursts of uploads into a single rebuild after `delay` seconds of quiet."""
+    global _REBUILD_TIMER
+    with _REBUILD_LOCK:
+        if _REBUILD_TIMER is not None:
+            _REBUILD_TIMER.cancel()
+        _REBUILD_TIMER = threading.Timer(delay, _run_scheduled_rebuild)
+        _REBUILD_TIMER.daemon = True
+        _REBUILD_TIMER.start()
+
+def process_upload_task(document_id: int, content: bytearray, content_type: str, filename: str):
+    status = "ready"
+    try:
+        if content_type == "application/pdf":
+            logger.info(f"Extracting text from PDF: {filename}")
+            text = extract_text_from_pdf(content)
+        else:
+            logger.info(f"Extracting text from image: {filename}")
+            text = extract_text_from_image(content)
+
+        path = save_text_to_file(filename, text)
+        logger.info(f"Text saved to {path}")
+    except Exception as e:
+        logger.error(f"Error extracting text for document {document_id}: {str(e)}")
+        status = "failed"
+
+    with SessionLocal() as db:
+        document = db.get(Document, document_id)
+        if document:
+            document.status = status
+            db.commit()
+
+    if status == "ready":
+        schedule_vector_store_rebuild()
+
 @router.post("/upload")
 async def upload_document(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"Receiving upload request for file: {file.filename}")
     
@@ -45,58 +90,42 @@ async def upload_document(
         raise HTTPException(status_code=400, detail="Unsupported file type")
     
     try:
-        temp_file_path = f"temp_{file.filename}"
-        with open(temp_file_path, "wb") as buffer:
-            chunk_size = 1024 * 1024
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                buffer.write(chunk)
-                await asyncio.sleep(0)
+        buffer = bytearray()
+        chunk_size = 1024 * 1024
+        while chunk := await file.read(chunk_size):
+            buffer.extend(chunk)
+            if len(buffer) > settings.MAX_FILE_SIZE:
+                raise HTTPException(status_code=413, detail="File too large")
+        content = buffer
         
-        logger.info(f"File uploaded successfully to temp location: {temp_file_path}")
+        logger.info(f"File received: {file.filename} ({len(content)} bytes)")
         
         filename = file.filename.rsplit(".", 1)[0]
-        
-        if file.content_type == "application/pdf":
-            logger.info(f"Extracting text from PDF: {filename}")
-            with open(temp_file_path, "rb") as f:
-                content = f.read()
-                text = extract_text_from_pdf(content)
-        else:
-            logger.info(f"Extracting text from image: {filename}")
-            with open(temp_file_path, "rb") as f:
-                content = f.read()
-                text = extract_text_from_image(content)
-        
-        os.remove(temp_file_path)
-        
-        path = save_text_to_file(filename, text)
-        logger.info(f"Text saved to {path}")
+        path = get_text_path(filename)
         
         document = Document(
             filename=file.filename,
             content_path=path,
             filetype=file.content_type,
+            status="pending",
         )
 
         db.add(document)
-        db.commit()
-        db.refresh(document)
+        await db.commit()
+        await db.refresh(document)
         logger.info(f"Document record created with ID: {document.id}")
         
-        background_tasks.add_task(rebuild_vector_store_task)
+        background_tasks.add_task(process_upload_task, document.id, content, file.content_type, filename)
         
         return {
-            "message": "File uploaded, text extracted and saved successfully",
+            "message": "File uploaded, text extraction in progress",
             "path": path,
-            "document_id": document.id
+            "document_id": document.id,
+            "status": document.status
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing upload: {str(e)}")
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
\ No newline at end of file
@@ -1,6 +1,9 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 class Settings(BaseSettings):
     DATABASE_URL: str
@@ -20,9 +23,58 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "uploads"
     MAX_FILE_SIZE: int = 10485760  # 10MB default
 
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_PRE_PING: bool = True
+
+    GEMINI_CACHE_PATH: str = "cache/gemini_responses.db"
+    GEMINI_CACHE_TTL: int = 86400
+    EMBEDDING_CACHE_PATH: str = "cache/embeddings.db"
+    EMBEDDING_BATCH_SIZE: int = 100
+    GEMINI_MAX_CONCURRENT_CALLS: int = 8
+    THEME_CACHE_MIN_CHARS: int = 200
+
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(database_url: str):
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=driver) if driver else url
+
+def is_memory_database(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+def get_engine_options(database_url: str):
+    if make_url(database_url).get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if is_memory_database(database_url):
+            # Each connection to :memory: is a separate database, so all sessions share one.
+            # File databases keep the default pool: a shared connection would mix transactions
+            options["poolclass"] = StaticPool
+        return options
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
 settings = Settings()
 
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(settings.DATABASE_URL, **get_engine_options(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    get_async_database_url(settings.DATABASE_URL),
+    **get_engine_options(settings.DATABASE_URL)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
\ No newline at end of file
@@ -1,5 +1,6 @@
-from app.models.document import Base
+from app.models.document import Base, ensure_document_columns
 from app.config import engine
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    ensure_document_columns(engine)
@@ -1,26 +1,35 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from app.api import upload, documents, query, theme_identification
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 import time
-from app.models.document import Base  
-from app.config import engine
+from contextlib import asynccontextmanager
+from app.core.init_db import init_db
 
 class TimeoutMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
+        process_time = (time.perf_counter_ns() - start_time) / 1e9
+        response.headers["X-Process-Time"] = f"{process_time:.6f}"
         return response
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    yield
+
 app = FastAPI(
     title="Theme Identification Chatbot",
     openapi_url="/api/openapi.json",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -35,15 +44,18 @@ app.add_middleware(
         "http://localhost:8000",
         "http://127.0.0.1:8000",
     ],
+    allow_origin_regex=r"https://.*\.up\.railway\.app",
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD"],
-    allow_headers=["*"],
-    expose_headers=["*"],
+    allow_headers=["Accept", "Authorization", "Content-Type"],
+    expose_headers=["X-Process-Time", "ETag"],
     max_age=86400,  # Cache preflight requests for 24 hours
 )
 
 app.add_middleware(TimeoutMiddleware)
 
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 app.add_middleware(
     TrustedHostMiddleware, allowed_hosts=["*"]
 )
@@ -55,6 +67,4 @@ app.include_router(theme_identification.router, prefix="/api")
 
 @app.get("/")
 def root():
-    return {"message": "API is running"}
-
-Base.metadata.create_all(bind=engine)  # run it once only 
\ No newline at end of file
+    return {"message": "API is running"} 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -11,4 +11,21 @@ class Document(Base):
     filename = Column(String, nullable=False)
     content_path = Column(String, nullable=False)
     filetype = Column(String, nullable=False)
-    uploaded_at = Column(DateTime, default=datetime.now)
\ No newline at end of file
+    uploaded_at = Column(DateTime, default=datetime.now)
+    status = Column(String, nullable=False, default="ready", server_default="ready")
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# Columns added after the initial schema; there are no migrations, so
+# ensure_document_columns adds them to existing tables
+DOCUMENT_COLUMNS = {
+    "status": "VARCHAR NOT NULL DEFAULT 'ready'",
+    "updated_at": "TIMESTAMP",
+}
+
+def ensure_document_columns(engine):
+    columns = {column["name"] for column in inspect(engine).get_columns(Document.__tablename__)}
+    missing = {name: ddl for name, ddl in DOCUMENT_COLUMNS.items() if name not in columns}
+    if missing:
+        with engine.begin() as conn:
+            for name, ddl in missing.items():
+                conn.execute(text(f"ALTER TABLE {Document.__tablename__} ADD COLUMN {name} {ddl}"))
\ No newline at end of file
@@ -1,81 +1,147 @@
-from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
+import asyncio
+import hashlib
+import mmap
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.document import Document
 import os
 
+def _char_boundary(file, pos: int, size: int) -> int:
+    """Move a byte offset back to the start of the UTF-8 character it falls in."""
+    if pos <= 0:
+        return 0
+    if pos >= size:
+        return size
+    back = min(pos, 3)
+    file.seek(pos - back)
+    window = file.read(back + 1)
+    i = back
+    while i > 0 and (window[i] & 0xC0) == 0x80:
+        i -= 1
+    return pos - back + i
+
+def read_chunk(path: str, start_pos: int, chunk_size: int) -> Optional[Tuple[str, bool]]:
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        return None
+    if start_pos >= size:
+        return None
+    
+    with open(path, "rb") as file:
+        start = _char_boundary(file, start_pos, size)
+        end = _char_boundary(file, start_pos + chunk_size, size)
+        file.seek(start)
+        blob = file.read(end - start)
+    return blob.decode("utf-8", errors="replace"), end >= size
+
+def read_content(path: str) -> Tuple[str, int, Optional[float]]:
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return "", 0, None
+    with file:
+        stat = os.fstat(file.fileno())
+        if not stat.st_size:
+            return "", 0, stat.st_mtime
+        # Decode straight from the page cache instead of through a buffered text reader
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            content = str(mapped, "utf-8", errors="replace")
+    return content, stat.st_size, stat.st_mtime
+
+DOCUMENT_LIST_COLUMNS = (
+    Document.id,
+    Document.filename,
+    Document.filetype,
+    Document.uploaded_at,
+    Document.content_path,
+    Document.status,
+)
+
 class DocumentService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def get_documents(self, page: int = 1, page_size: int = 20) -> Dict:
-        offset = (page - 1) * page_size
-        documents = self.db.query(Document).offset(offset).limit(page_size).all()
-        total = self.db.query(Document).count()
+    async def get_version(self, document_id: Optional[int] = None) -> Optional[str]:
+        """ETag for the documents table, or a single document, from its row count and last update.
+
+        None when a single document is asked for and does not exist.
+        """
+        stmt = select(func.count(Document.id), func.max(Document.updated_at))
+        if document_id is not None:
+            stmt = stmt.where(Document.id == document_id)
+        count, updated_at = (await self.db.execute(stmt)).one()
+        if document_id is not None and not count:
+            return None
+        return '"' + hashlib.md5(f"{count}:{updated_at}".encode()).hexdigest() + '"'
+
+    async def get_documents(self, page: int = 1, page_size: int = 20, after_id: Optional[int] = None) -> Dict:
+        # The total rides along as an uncorrelated scalar subquery, so a page is one round trip
+        total_count = select(func.count(Document.id)).scalar_subquery().label("total")
+        stmt = select(*DOCUMENT_LIST_COLUMNS, total_count).order_by(Document.id).limit(page_size)
+        if after_id is not None:
+            # Keyset pagination avoids scanning past large offsets
+            stmt = stmt.where(Document.id > after_id)
+        else:
+            stmt = stmt.offset((page - 1) * page_size)
+        rows = (await self.db.execute(stmt)).all()
+        if rows:
+            total = rows[0].total
+        else:
+            total = await self.db.scalar(select(func.count(Document.id)))
         
         return {
             "documents": [
-                {
-                    "id": doc.id,
-                    "filename": doc.filename,
-                    "filetype": doc.filetype,
-                    "uploaded_at": doc.uploaded_at,
-                    "content_path": doc.content_path,
-                }
-                for doc in documents
+                {column.key: row._mapping[column.key] for column in DOCUMENT_LIST_COLUMNS}
+                for row in rows
             ],
             "total": total,
             "page": page,
             "page_size": page_size
         }
 
-    def get_document(self, document_id: int) -> Optional[Dict]:
-        document = self.db.query(Document).filter(Document.id == document_id).first()
+    async def get_document(self, document_id: int) -> Optional[Dict]:
+        document = await self.db.scalar(select(Document).where(Document.id == document_id))
         if not document:
             return None
         
-        content = ""
-        if os.path.exists(document.content_path):
-            with open(document.content_path, "r") as file:
-                content = file.read()
+        content, size, last_modified = await asyncio.to_thread(read_content, document.content_path)
         
         return {
             "id": document.id,
             "filename": document.filename,
             "filetype": document.filetype,
             "uploaded_at": document.uploaded_at,
+            "status": document.status,
             "content": content,
             "metadata": {
-                "size": os.path.getsize(document.content_path) if os.path.exists(document.content_path) else 0,
-                "last_modified": os.path.getmtime(document.content_path) if os.path.exists(document.content_path) else None
+                "size": size,
+                "last_modified": last_modified
             }
         }
 
-    def get_document_chunk(self, document_id: int, chunk_index: int, chunk_size: int = 5000) -> Optional[Dict]:
-        document = self.db.query(Document).filter(Document.id == document_id).first()
+    async def get_document_chunk(self, document_id: int, chunk_index: int, chunk_size: int = 5000) -> Optional[Dict]:
+        document = await self.db.scalar(select(Document).where(Document.id == document_id))
         if not document:
             return None
         
-        content = ""
-        if os.path.exists(document.content_path):
-            with open(document.content_path, "r") as file:
-                content = file.read()
-        
-        start_pos = chunk_index * chunk_size
-        end_pos = min(start_pos + chunk_size, len(content))
-        
-        if start_pos >= len(content):
+        # Chunks are byte ranges of the UTF-8 text file, so only the requested range is read
+        chunk = await asyncio.to_thread(read_chunk, document.content_path, chunk_index * chunk_size, chunk_size)
+        if chunk is None:
             return None
+        content, is_last_chunk = chunk
         
         return {
             "document_id": document.id,
             "chunk_index": chunk_index,
             "chunk_size": chunk_size,
-            "content": content[start_pos:end_pos],
-            "is_last_chunk": end_pos >= len(content)
+            "content": content,
+            "is_last_chunk": is_last_chunk
         }
 
-    def batch_process_documents(self, document_ids: List[int], operation: str, params: Dict = None) -> Dict:
-        documents = self.db.query(Document).filter(Document.id.in_(document_ids)).all()
+    async def batch_process_documents(self, document_ids: List[int], operation: str, params: Dict = None) -> Dict:
+        documents = (await self.db.scalars(select(Document).where(Document.id.in_(document_ids)))).all()
         if len(documents) != len(document_ids):
             return {"error": "Some document IDs not found"}
         
@@ -83,22 +149,25 @@ class DocumentService:
             return {"status": "success", "processed": len(documents)}
         
         elif operation == "identify_themes":
-            documents_with_content = []
-            for doc in documents:
-                if os.path.exists(doc.content_path):
-                    with open(doc.content_path, "r") as file:
-                        content = file.read()
-                    documents_with_content.append({
-                        "id": doc.id,
-                        "filename": doc.filename,
-                        "content": content
-                    })
+            # Read all files concurrently; files missing on disk are skipped
+            contents = await asyncio.gather(
+                *(asyncio.to_thread(read_content, doc.content_path) for doc in documents)
+            )
+            documents_with_content = [
+                {
+                    "id": doc.id,
+                    "filename": doc.filename,
+                    "content": content
+                }
+                for doc, (content, size, last_modified) in zip(documents, contents)
+                if last_modified is not None
+            ]
             
             max_themes = params.get("max_themes", 5) if params else 5
             relevance_threshold = params.get("relevance_threshold", 0.7) if params else 0.7
             
-            from backend.app.services.theme_identification import identify_themes_across_documents
-            themes = identify_themes_across_documents(
+            from app.services.theme_identification import identify_themes_across_documents
+            themes = await identify_themes_across_documents(
                 documents_with_content, 
                 max_themes=max_themes,
                 relevance_threshold=relevance_threshold
@@ -0,0 +1,90 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import orjson
+from typing import Any, Optional
+from collections import OrderedDict
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class GeminiResponseCache:
+    """Parsed Gemini responses keyed on a hash of (model, prompt).
+
+    A small in-memory LRU sits in front of a SQLite table so repeated prompts
+    skip the API call across restarts. An empty `path` keeps the cache in memory only.
+    """
+
+    def __init__(self, path: str, ttl: int = 86400, memory_size: int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        return hashlib.blake2b(f"{model_name}\0{prompt}".encode(), digest_size=16).hexdigest()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Gemini cache disabled on disk: {str(e)}")
+                self.path = ""
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            conn = self._connection()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                return None
+            value = orjson.loads(row[0])
+            self._remember(key, row[1], value)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            conn = self._connection()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, orjson.dumps(value), now)
+            )
+            conn.commit()
+
+    def _remember(self, key: str, created_at: float, value: Any) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+gemini_cache = GeminiResponseCache(settings.GEMINI_CACHE_PATH, ttl=settings.GEMINI_CACHE_TTL)
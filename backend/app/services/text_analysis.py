@@ -1,45 +1,58 @@
+import re
 import logging
 import hashlib
-import nltk
-from typing import List, Dict, Any
-from nltk.tokenize import sent_tokenize
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt', quiet=True)
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Tuple
 
 logger = logging.getLogger(__name__)
 
+# A sentence runs up to terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace or the end of the text, so decimals like 3.14 are not split
+_SENT_RE = re.compile(r'\S.*?(?:[.!?]+["\')\]]*(?=\s|$)|$)', re.S)
+
+def sentence_spans(content: str) -> List[Tuple[int, int]]:
+    # Every non-blank text yields at least one span, since the last sentence may end at $
+    return [match.span() for match in _SENT_RE.finditer(content)]
+
+@lru_cache(maxsize=8192)
 def generate_text_id(text: str) -> str:
     content_sample = text.strip()[:100].strip()
-    hash_obj = hashlib.md5(content_sample.encode())
-    return hash_obj.hexdigest()[:12]
+    return hashlib.blake2b(content_sample.encode(), digest_size=6).hexdigest()
+
+def generate_text_ids(texts: List[str]) -> List[str]:
+    """Batch form of generate_text_id."""
+    return [generate_text_id(text) for text in texts]
 
 class TextAnalyzer:
     @staticmethod
-    def split_into_paragraphs(text: str) -> List[Dict[str, Any]]:
-        paragraphs = []
-        text = text.replace('\r\n', '\n')
-        raw_paragraphs = text.split('\n\n')
-        start_pos = 0
-        for i, para in enumerate(raw_paragraphs):
-            para = para.strip()
-            if not para:
-                start_pos += 2
-                continue
-            para_pos = text.find(para, start_pos)
-            if para_pos == -1:
-                continue
-            end_pos = para_pos + len(para)
-            paragraphs.append({
-                "index": i,
-                "content": para,
-                "position": {
-                    "start": para_pos,
-                    "end": end_pos
+    def iter_paragraphs(text: str) -> Iterator[Dict[str, Any]]:
+        """Yield paragraphs one at a time without building the full list."""
+        if '\r' in text:
+            text = text.replace('\r\n', '\n')
+        cursor = 0
+        i = 0
+        while cursor <= len(text):
+            sep = text.find('\n\n', cursor)
+            if sep == -1:
+                sep = len(text)
+            raw = text[cursor:sep]
+            para = raw.strip()
+            if para:
+                para_pos = cursor + len(raw) - len(raw.lstrip())
+                yield {
+                    "index": i,
+                    "content": para,
+                    "position": {
+                        "start": para_pos,
+                        "end": para_pos + len(para)
+                    }
                 }
-            })
-            start_pos = end_pos
+            cursor = sep + 2
+            i += 1
+
+    @staticmethod
+    def split_into_paragraphs(text: str) -> List[Dict[str, Any]]:
+        paragraphs = list(TextAnalyzer.iter_paragraphs(text))
         logger.debug(f"Split document into {len(paragraphs)} paragraphs")
         return paragraphs
 
@@ -47,15 +60,12 @@ class TextAnalyzer:
     def split_paragraph_into_sentences(paragraph: Dict[str, Any]) -> List[Dict[str, Any]]:
         content = paragraph["content"]
         para_start = paragraph["position"]["start"]
-        sentence_texts = sent_tokenize(content)
+        spans = sentence_spans(content)
+        texts = [content[sent_start:sent_end] for sent_start, sent_end in spans]
         sentences = []
-        start_pos = 0
-        for i, sent_text in enumerate(sentence_texts):
-            sent_pos = content.find(sent_text, start_pos)
-            if sent_pos == -1:
-                continue
-            abs_start = para_start + sent_pos
-            abs_end = abs_start + len(sent_text)
+        for i, ((sent_start, sent_end), sent_text, sent_id) in enumerate(zip(spans, texts, generate_text_ids(texts))):
+            abs_start = para_start + sent_start
+            abs_end = para_start + sent_end
             sentences.append({
                 "index": i,
                 "paragraph_index": paragraph["index"],
@@ -64,9 +74,8 @@ class TextAnalyzer:
                     "start": abs_start,
                     "end": abs_end
                 },
-                "id": generate_text_id(sent_text)
+                "id": sent_id
             })
-            start_pos = sent_pos + len(sent_text)
         return sentences
 
     @staticmethod
@@ -74,10 +83,11 @@ class TextAnalyzer:
         try:
             paragraphs = TextAnalyzer.split_into_paragraphs(text)
             sentences = []
-            for paragraph in paragraphs:
+            paragraph_ids = generate_text_ids([paragraph["content"] for paragraph in paragraphs])
+            for paragraph, paragraph_id in zip(paragraphs, paragraph_ids):
                 paragraph_sentences = TextAnalyzer.split_paragraph_into_sentences(paragraph)
                 sentences.extend(paragraph_sentences)
-                paragraph["id"] = generate_text_id(paragraph["content"])
+                paragraph["id"] = paragraph_id
                 paragraph["document_id"] = document_id
             for sentence in sentences:
                 sentence["document_id"] = document_id
@@ -97,4 +107,15 @@ class TextAnalyzer:
                 "error": str(e),
                 "paragraphs": [],
                 "sentences": []
-            } 
\ No newline at end of file
+            } 
+
+@lru_cache(maxsize=32)
+def analyze_document_cached(document_id: int, content_path: str, mtime_ns: int) -> Dict[str, Any]:
+    """analyze_document for a stored file, memoized on its modification time.
+
+    The text is read here rather than passed in, so the cache key stays small and a
+    re-uploaded file is analyzed afresh. The returned analysis is shared between callers
+    and must not be modified.
+    """
+    with open(content_path, 'r', encoding='utf-8', buffering=1 << 20) as f:
+        return TextAnalyzer.analyze_document(document_id, f.read())
\ No newline at end of file
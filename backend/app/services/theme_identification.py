@@ -1,17 +1,39 @@
-import re
 import logging
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional
+from collections import defaultdict
+from heapq import nlargest
+from itertools import islice
+from operator import itemgetter
+import orjson
+import numpy as np
 import google.generativeai as genai
 from app.config import settings
+from app.services.gemini_cache import gemini_cache, GeminiResponseCache
+from app.services.vectorstore.gemini_embeddings import GeminiEmbeddings
+from app.services.vectorstore.query_engine import SemanticQueryCache, normalize_embedding
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
 genai.configure(api_key=settings.GEMINI_API_KEY)
 model = genai.GenerativeModel(settings.MODEL_NAME)
 
+THEME_CACHE_THRESHOLD = 0.92
+# Matched text beyond this is left out of the cache embedding
+THEME_EMBED_CHARS = 8000
+
+# Themes for earlier match sets, reused when new matches over the same documents read alike
+theme_cache = SemanticQueryCache(threshold=THEME_CACHE_THRESHOLD, ttl=settings.GEMINI_CACHE_TTL)
+theme_embeddings = GeminiEmbeddings()
+
+def embed_matches(documents: List[Dict[str, str]]) -> Optional[np.ndarray]:
+    text = " ".join(doc["content"] for doc in documents)[:THEME_EMBED_CHARS]
+    try:
+        return normalize_embedding(theme_embeddings.embed_query(text))
+    except Exception as e:
+        logger.warning(f"Could not embed matches for the theme cache: {str(e)}")
+        return None
+
 def identify_themes(matches: List[Dict[str, Any]], theme_count: int = 3) -> List[Dict[str, Any]]:
     if not matches:
         logger.warning("No matches provided to identify_themes")
@@ -35,19 +57,38 @@ def identify_themes(matches: List[Dict[str, Any]], theme_count: int = 3) -> List
     
     try:
         prompt = create_theme_identification_prompt(documents_text, theme_count)
+        # Tiny payloads are cheap to regenerate, so they neither pay for an embedding nor take a cache slot
+        cacheable = sum(len(doc["content"]) for doc in documents_text) >= settings.THEME_CACHE_MIN_CHARS
+        embedding = None
+        if cacheable:
+            cache_key = theme_cache.make_key(prompt, theme_count)
+            cached = theme_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            # Only matches over the same documents may share themes, since themes cite them
+            scope = f"{theme_count}\0" + "\0".join(sorted(set(document_ids)))
+            embedding = embed_matches(documents_text)
+            if embedding is not None:
+                cached = theme_cache.get_similar(embedding, scope)
+                if cached is not None:
+                    logger.info("Using themes cached for semantically similar matches")
+                    return cached
+        
         themes = call_gemini_api(prompt)
         
         formatted_themes = format_themes(themes, document_ids)
         logger.info(f"Successfully identified {len(formatted_themes)} themes")
         
+        if embedding is not None and formatted_themes:
+            theme_cache.put(cache_key, embedding, scope, formatted_themes)
         return formatted_themes
     
     except Exception as e:
         logger.error(f"Error in theme identification: {str(e)}")
         return []
 
-def create_theme_identification_prompt(documents: List[Dict[str, str]], theme_count: int) -> str:
-    prompt = f"""Analyze the following document excerpts and identify exactly {theme_count} common themes across them.
+_PROMPT_HEADER = """Analyze the following document excerpts and identify exactly {theme_count} common themes across them.
 
 For each document excerpt, I've provided:
 1. A document identifier
@@ -56,10 +97,7 @@ For each document excerpt, I've provided:
 Documents:
 """
 
-    for i, doc in enumerate(documents):
-        prompt += f"\nDOCUMENT {i+1} ({doc['id']}):\n{doc['content']}\n"
-    
-    prompt += f"""
+_PROMPT_FOOTER = """
 Based on these document excerpts, identify exactly {theme_count} distinct themes that are present across multiple documents.
 
 For each theme:
@@ -76,7 +114,7 @@ IMPORTANT: Your response MUST be a valid JSON array with the following structure
     "supporting_documents": ["Doc1", "Doc2"],
     "evidence": "Brief evidence for this theme from the documents"
   }}
-  {', {...}' if theme_count > 1 else ''}
+  {more_themes}
 ]
 
 STRICTLY follow these rules:
@@ -87,10 +125,29 @@ STRICTLY follow these rules:
 
 Return only the raw JSON array.
 """
-    
-    return prompt
+
+def create_theme_identification_prompt(documents: List[Dict[str, str]], theme_count: int) -> str:
+    parts = [_PROMPT_HEADER.format(theme_count=theme_count)]
+    parts.extend(f"\nDOCUMENT {i+1} ({doc['id']}):\n{doc['content']}\n" for i, doc in enumerate(documents))
+    parts.append(_PROMPT_FOOTER.format(
+        theme_count=theme_count,
+        more_themes=', {...}' if theme_count > 1 else ''
+    ))
+    return "".join(parts)
 
 def call_gemini_api(prompt: str) -> List[Dict[str, Any]]:
+    cache_key = GeminiResponseCache.make_key(settings.MODEL_NAME, prompt)
+    themes = gemini_cache.get(cache_key)
+    if themes is not None:
+        logger.info("Using cached Gemini themes")
+        return themes
+    
+    themes = request_themes(prompt)
+    if themes:
+        gemini_cache.put(cache_key, themes)
+    return themes
+
+def request_themes(prompt: str) -> List[Dict[str, Any]]:
     
     logger.info("Calling Gemini API for theme identification")
     
@@ -108,21 +165,20 @@ def call_gemini_api(prompt: str) -> List[Dict[str, Any]]:
             content = content[:-3].strip()
         
         try:
-            themes = json.loads(content)
+            themes = orjson.loads(content)
             return themes
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"JSON parsing error: {str(e)}")
             logger.error(f"Raw response content: {content[:500]}")
             
-            json_pattern = r'(\[.*\])'
-            json_match = re.search(json_pattern, content, re.DOTALL)
+            json_array = extract_json_array(content)
             
-            if json_match:
+            if json_array:
                 try:
-                    themes = json.loads(json_match.group(1))
+                    themes = orjson.loads(json_array)
                     logger.info("Successfully extracted JSON from partial response")
                     return themes
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     logger.error("Failed to extract valid JSON from response")
             
             return []
@@ -131,6 +187,34 @@ def call_gemini_api(prompt: str) -> List[Dict[str, Any]]:
         logger.error(f"API request error: {str(e)}")
         raise
 
+def extract_json_array(content: str) -> Optional[str]:
+    """Slice out the first balanced JSON array, skipping brackets inside strings."""
+    start = content.find("[")
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(content)):
+        char = content[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+            if depth == 0:
+                return content[start:i + 1]
+    return None
+
 def format_themes(themes: List[Dict[str, Any]], document_ids: List[str]) -> List[Dict[str, Any]]:
     formatted_themes = []
     
@@ -156,8 +240,8 @@ async def identify_themes_across_documents(
     max_themes: int = 5,
     relevance_threshold: float = 0.7
 ) -> List[Dict[str, Any]]:
-    max_workers = min(settings.MAX_DOCUMENTS_PER_BATCH, len(documents))
-    themes = []
+    # Bounds concurrent Gemini requests without tying up a thread per document
+    semaphore = asyncio.Semaphore(settings.MAX_DOCUMENTS_PER_BATCH)
     
     async def process_document(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
         sections = extract_key_sections(doc["content"])
@@ -173,20 +257,18 @@ async def identify_themes_across_documents(
         
         return doc_themes
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        loop = asyncio.get_event_loop()
-        tasks = [
-            loop.run_in_executor(executor, process_document, doc)
-            for doc in documents
-        ]
-        results = await asyncio.gather(*tasks)
+    async def bounded(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+        async with semaphore:
+            return await process_document(doc)
+
+    results = await asyncio.gather(*(bounded(doc) for doc in documents))
     
     all_themes = []
     for doc_themes in results:
         all_themes.extend(doc_themes)
     
     merged_themes = merge_similar_themes(all_themes)
-    return sorted(merged_themes, key=lambda x: x["relevance"], reverse=True)[:max_themes]
+    return nlargest(max_themes, merged_themes, key=itemgetter("relevance"))
 
 def extract_key_sections(content: str, max_sections: int = 5) -> List[str]:
     paragraphs = content.split("\n\n")
@@ -194,11 +276,7 @@ def extract_key_sections(content: str, max_sections: int = 5) -> List[str]:
     if paragraphs:
         sections.append(paragraphs[0])
     
-    remaining_paragraphs = sorted(
-        paragraphs[1:],
-        key=lambda x: len(x),
-        reverse=True
-    )[:max_sections-1]
+    remaining_paragraphs = nlargest(max_sections - 1, islice(paragraphs, 1, None), key=len)
     sections.extend(remaining_paragraphs)
     
     return sections
@@ -217,7 +295,7 @@ async def identify_themes_in_text(
 
 Text: {text[:4000]}"""
 
-        response = model.generate_content(prompt)
+        response = await asyncio.to_thread(model.generate_content, prompt)
         content = response.text
         
         themes = []
@@ -245,6 +323,15 @@ Text: {text[:4000]}"""
         return []
 
 def merge_similar_themes(themes: List[Dict[str, Any]], similarity_threshold: float = 0.8) -> List[Dict[str, Any]]:
+    word_sets = [frozenset(theme["name"].lower().split()) for theme in themes]
+    
+    # A positive Jaccard threshold needs at least one shared word, so only themes
+    # sharing a bucket are compared instead of every pair
+    buckets = defaultdict(list)
+    for i, words in enumerate(word_sets):
+        for word in words:
+            buckets[word].append(i)
+    
     merged = []
     used = set()
     
@@ -255,11 +342,17 @@ def merge_similar_themes(themes: List[Dict[str, Any]], similarity_threshold: flo
         current_theme = theme1.copy()
         used.add(i)
         
-        for j, theme2 in enumerate(themes[i+1:], i+1):
+        if similarity_threshold > 0:
+            candidates = sorted({j for word in word_sets[i] for j in buckets[word] if j > i})
+        else:
+            candidates = range(i + 1, len(themes))
+        
+        for j in candidates:
             if j in used:
                 continue
                 
-            if are_themes_similar(theme1["name"], theme2["name"], similarity_threshold):
+            if jaccard_similarity(word_sets[i], word_sets[j]) >= similarity_threshold:
+                theme2 = themes[j]
                 current_theme["relevance"] = max(current_theme["relevance"], theme2["relevance"])
                 current_theme["evidence"] += f"\n{theme2['evidence']}"
                 used.add(j)
@@ -268,11 +361,11 @@ def merge_similar_themes(themes: List[Dict[str, Any]], similarity_threshold: flo
     
     return merged
 
+def jaccard_similarity(words1: frozenset, words2: frozenset) -> float:
+    union = len(words1 | words2)
+    return len(words1 & words2) / union if union else 0.0
+
 def are_themes_similar(theme1: str, theme2: str, threshold: float) -> bool:
-    words1 = set(theme1.lower().split())
-    words2 = set(theme2.lower().split())
-    
-    intersection = len(words1.intersection(words2))
-    union = len(words1.union(words2))
-    
-    return intersection / union if union > 0 else 0 >= threshold 
\ No newline at end of file
+    words1 = frozenset(theme1.lower().split())
+    words2 = frozenset(theme2.lower().split())
+    return jaccard_similarity(words1, words2) >= threshold
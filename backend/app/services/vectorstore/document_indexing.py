@@ -1,30 +1,88 @@
 import os
-import re
 import shutil
-import hashlib
 import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from langchain_chroma import Chroma
 from .gemini_embeddings import GeminiEmbeddings
-from langchain_community.document_loaders import TextLoader
+from .query_engine import extract_page_info, invalidate_vectordb, mark_store_built
+from typing import Iterator, List, Optional
+from langchain_core.documents import Document as LCDocument
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 CHROMA_DB_PATH = "chroma_store"
+READ_BLOCK_SIZE = 1 << 20
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+# Below this many characters of text splitting stays in-process
+PARALLEL_SPLIT_CHARS = 8 << 20
+SPLIT_WORKERS = min(os.cpu_count() or 1, 8)
 
-def extract_page_info(text):
-    page_match = re.search(r"--- Page (\d+) ---", text)
-    if page_match:
-        return int(page_match.group(1))
-    return None
+_SPLIT_POOL: Optional[ProcessPoolExecutor] = None
+_SPLIT_POOL_LOCK = threading.Lock()
 
-def extract_paragraph_info(text, filename):
-    # Create a unique paragraph identifier based on content hash
-    content_start = text.strip()[:50].strip()
-    hash_obj = hashlib.md5(content_start.encode())
-    paragraph_id = int(hash_obj.hexdigest()[:8], 16) % 100
-    return paragraph_id or 1
+def _get_split_pool() -> ProcessPoolExecutor:
+    global _SPLIT_POOL
+    if _SPLIT_POOL is None:
+        with _SPLIT_POOL_LOCK:
+            if _SPLIT_POOL is None:
+                # spawn, not fork: the API process is multi-threaded
+                _SPLIT_POOL = ProcessPoolExecutor(
+                    max_workers=SPLIT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _SPLIT_POOL
+
+def _split_one(doc: LCDocument) -> List[LCDocument]:
+    chunks = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    ).split_documents([doc])
+    # A block's "paragraph" is the index of the paragraph it starts in; each chunk gets the
+    # index of the paragraph it starts in, counted the way TextAnalyzer numbers them
+    text = doc.page_content
+    first_paragraph = doc.metadata.get("paragraph", 0)
+    for chunk in chunks:
+        start = chunk.metadata.pop("start_index")
+        chunk.metadata["paragraph"] = first_paragraph + text.count("\n\n", 0, start)
+    return chunks
+
+def split_documents(docs: List[LCDocument]) -> List[LCDocument]:
+    if sum(len(doc.page_content) for doc in docs) < PARALLEL_SPLIT_CHARS:
+        return [chunk for doc in docs for chunk in _split_one(doc)]
+    # Splitting is pure-Python CPU work, so large corpora are spread over processes
+    split_lists = _get_split_pool().map(_split_one, docs)
+    return [chunk for split in split_lists for chunk in split]
+
+def assign_chunk_metadata(split_docs: List[LCDocument]) -> None:
+    # Chunks carry their page so queries need not scan the text for the marker
+    for doc in split_docs:
+        page_num = extract_page_info(doc.page_content)
+        if page_num:
+            doc.metadata["page"] = page_num
+
+def iter_text_blocks(path: str, filename: str, block_size: int = READ_BLOCK_SIZE) -> Iterator[LCDocument]:
+    # Large files are handed to the splitter in line-aligned blocks rather than one string.
+    # Blocks only break before a non-blank line, so no paragraph break straddles two blocks
+    # and each block knows the index of the paragraph it starts in
+    buffer = []
+    size = 0
+    paragraph = 0
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if size >= block_size and line != "\n":
+                content = "".join(buffer)
+                yield LCDocument(page_content=content, metadata={"source": path, "filename": filename, "paragraph": paragraph})
+                paragraph += content.count("\n\n")
+                buffer = []
+                size = 0
+            buffer.append(line)
+            size += len(line)
+    if buffer:
+        yield LCDocument(page_content="".join(buffer), metadata={"source": path, "filename": filename, "paragraph": paragraph})
 
 def build_vector_store(directory_path: str = "data/"):
     all_docs = []
@@ -41,28 +99,21 @@ def build_vector_store(directory_path: str = "data/"):
         os.makedirs(directory_path, exist_ok=True)
         return None
     
-    txt_files = [f for f in os.listdir(directory_path) if f.endswith(".txt")]
+    with os.scandir(directory_path) as entries:
+        txt_files = [entry for entry in entries if entry.name.endswith(".txt") and entry.is_file()]
     if not txt_files:
         logger.warning(f"No .txt files found in {directory_path}. Vector store creation skipped.")
         return None
     
-    logger.info(f"Found {len(txt_files)} text files: {', '.join(txt_files)}")
+    logger.info(f"Found {len(txt_files)} text files")
     
-    for filename in txt_files:
-        path = os.path.join(directory_path, filename)
+    for entry in txt_files:
         try:
-            with open(path, 'r', encoding='utf-8') as file:
-                text = file.read()
-
-            loader = TextLoader(path)
-            documents = loader.load()
-
-            for doc in documents:
-                doc.metadata["filename"] = filename
+            documents = list(iter_text_blocks(entry.path, entry.name))
             all_docs.extend(documents)
-            logger.info(f"Processed {filename}: {len(documents)} document chunks")
+            logger.info(f"Processed {entry.name}: {len(documents)} document chunks")
         except Exception as e:
-            logger.error(f"Error processing {filename}: {str(e)}")
+            logger.error(f"Error processing {entry.name}: {str(e)}")
 
     if not all_docs:
         logger.warning("No documents were loaded. Vector store creation skipped.")
@@ -71,20 +122,13 @@ def build_vector_store(directory_path: str = "data/"):
     logger.info(f"Total document chunks: {len(all_docs)}")
     
     try:
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        split_docs = text_splitter.split_documents(all_docs)
+        split_docs = split_documents(all_docs)
         logger.info(f"Split into {len(split_docs)} chunks")
 
-        # Process metadata for each document chunk
-        for doc in split_docs:
-            page_num = extract_page_info(doc.page_content)
-            if page_num:
-                doc.metadata["page"] = page_num
-                
-            filename = doc.metadata.get("filename", "Unknown")
-            para_id = extract_paragraph_info(doc.page_content, filename)
-            doc.metadata["paragraph_id"] = para_id
+        assign_chunk_metadata(split_docs)
 
+        # Drop the shared query-side client before its files are replaced
+        invalidate_vectordb()
         if os.path.exists(CHROMA_DB_PATH):
             logger.info(f"Removing existing vector store at {CHROMA_DB_PATH}")
             shutil.rmtree(CHROMA_DB_PATH)
@@ -95,9 +139,13 @@ def build_vector_store(directory_path: str = "data/"):
         vectordb = Chroma.from_documents(
             documents=split_docs,
             embedding=embedding_function,
-            persist_directory=CHROMA_DB_PATH
+            persist_directory=CHROMA_DB_PATH,
+            # Embeddings are unit length, so inner product ranks exactly like cosine
+            collection_metadata={"hnsw:space": "ip"}
         )
+        mark_store_built()
             
+        invalidate_vectordb()
         logger.info(f"Vector store created successfully at {CHROMA_DB_PATH}")
         return vectordb
     except Exception as e:
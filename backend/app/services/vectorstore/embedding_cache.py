@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Stay under SQLite's default limit on bound parameters per statement
+MAX_SQL_PARAMS = 900
+
+class EmbeddingCache:
+    """Document embeddings stored on disk, keyed by a hash of (model, text).
+
+    Rebuilding the vector store only has to embed chunks that changed. An empty
+    `path` disables the cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode()).hexdigest()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute("CREATE TABLE IF NOT EXISTS emb (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache disabled: {str(e)}")
+                self.path = ""
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return found
+            for i in range(0, len(keys), MAX_SQL_PARAMS):
+                chunk = keys[i:i + MAX_SQL_PARAMS]
+                rows = conn.execute(
+                    f"SELECT key, vec FROM emb WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, embeddings: Dict[str, List[float]]) -> None:
+        with self._lock:
+            conn = self._connection()
+            if conn is None or not embeddings:
+                return
+            conn.executemany(
+                "INSERT OR REPLACE INTO emb (key, vec) VALUES (?, ?)",
+                [(key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in embeddings.items()]
+            )
+            conn.commit()
+
+embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH)
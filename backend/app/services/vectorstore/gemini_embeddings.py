@@ -1,30 +1,168 @@
+import time
+import random
+import logging
+import numpy as np
 import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from google.api_core.exceptions import InvalidArgument, ResourceExhausted
 from langchain.embeddings.base import Embeddings
-from typing import List
+from typing import List, Optional
 from app.config import settings
+from .embedding_cache import EmbeddingCache, embedding_cache
+
+logger = logging.getLogger(__name__)
 
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+# batchEmbedContents accepts at most 100 texts per request
+MAX_BATCH_SIZE = 100
+# Requests over 4 MiB are rejected; leave headroom for the JSON envelope
+MAX_BATCH_BYTES = 3_000_000
+EMBED_WORKERS = 6
+MAX_RETRIES = 3
+
+def normalize_rows(vectors: List[List[float]]) -> List[List[float]]:
+    # Unit-length vectors make cosine similarity a plain inner product in the index
+    if not vectors:
+        return []
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    return matrix.tolist()
+
+def partition_texts(texts: List[str], max_items: int, max_bytes: int) -> List[List[str]]:
+    # Greedily fill each batch until it reaches the item or UTF-8 size limit
+    batches = []
+    current = []
+    current_bytes = 0
+    for text in texts:
+        text_bytes = len(text.encode("utf-8"))
+        if current and (len(current) == max_items or current_bytes + text_bytes > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(text)
+        current_bytes += text_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+@lru_cache(maxsize=2048)
+def _embed_query(model_name: str, text: str) -> tuple:
+    # Keyed on the model too, so switching models never serves stale vectors
+    response = genai.embed_content(
+        model=model_name,
+        content=text,
+        task_type="retrieval_query"
+        )
+    return tuple(response["embedding"])
+
 class GeminiEmbeddings(Embeddings):
-    def __init__(self, model_name: str = "models/embedding-001"):
+    def __init__(self, model_name: str = "models/embedding-001", batch_size: int = settings.EMBEDDING_BATCH_SIZE, cache: Optional[EmbeddingCache] = None, normalize: bool = True):
         self.model_name = model_name
+        self.normalize = normalize
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.cache = cache if cache is not None else embedding_cache
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            response = genai.embed_content(
-                model=self.model_name,
-                content=text,
-                task_type="retrieval_document"
-                )
-            embeddings.append(response["embedding"])
+        embeddings = self._embed_documents(texts)
+        return normalize_rows(embeddings) if self.normalize else embeddings
+
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Repeated chunks (headers, footers, page markers) are embedded once and fanned back out
+        positions = {}
+        for i, text in enumerate(texts):
+            positions.setdefault(text, []).append(i)
+        if len(positions) == len(texts):
+            return self._embed_cached(texts)
+        
+        unique_texts = list(positions)
+        embeddings = [None] * len(texts)
+        for text, embedding in zip(unique_texts, self._embed_cached(unique_texts)):
+            for i in positions[text]:
+                embeddings[i] = embedding
         return embeddings
 
-    def embed_query(self, text: str) -> List[float]:
+    def _embed_cached(self, texts: List[str]) -> List[List[float]]:
+        if not self.cache.path:
+            return self._embed_unique(texts)
+        
+        keys = [self.cache.make_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            new_embeddings = dict(zip(
+                (keys[i] for i in missing),
+                self._embed_unique([texts[i] for i in missing])
+            ))
+            self.cache.put_many(new_embeddings)
+            found.update(new_embeddings)
+        return [found[key] for key in keys]
+
+    def _embed_unique(self, texts: List[str]) -> List[List[float]]:
+        batches = partition_texts(texts, self.batch_size, MAX_BATCH_BYTES)
+        if len(batches) <= 1:
+            return [embedding for batch in batches for embedding in self._embed_batch(batch)]
+        
+        # Overlap request latency across batches; results are slotted back by batch index
+        results = [None] * len(batches)
+        with ThreadPoolExecutor(max_workers=min(EMBED_WORKERS, len(batches))) as executor:
+            futures = {executor.submit(self._embed_batch, batch, True): idx for idx, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+    def _embed_batch(self, batch: List[str], jitter: bool = False) -> List[List[float]]:
+        if jitter:
+            # Spread out the first wave of requests to avoid a rate-limit burst
+            time.sleep(random.random() * 0.05)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = genai.embed_content(
+                    model=self.model_name,
+                    content=batch,
+                    task_type="retrieval_document"
+                    )
+                return response["embedding"]
+            except InvalidArgument as e:
+                if len(batch) > 1:
+                    # Most likely an oversized payload; halve the batch and try each half
+                    logger.warning(f"Batch of {len(batch)} texts rejected, splitting it: {str(e)}")
+                    middle = len(batch) // 2
+                    return self._embed_batch(batch[:middle]) + self._embed_batch(batch[middle:])
+                logger.warning(f"Batch embedding rejected: {str(e)}")
+                break
+            except ResourceExhausted as e:
+                if attempt == MAX_RETRIES:
+                    logger.warning(f"Batch embedding rate limited after {MAX_RETRIES} retries: {str(e)}")
+                    break
+                time.sleep(2 ** attempt + random.random())
+            except Exception as e:
+                logger.warning(f"Batch embedding failed, embedding {len(batch)} texts one by one: {str(e)}")
+                break
+        return [self._embed_document(text) for text in batch]
+
+    def _embed_document(self, text: str) -> List[float]:
         response = genai.embed_content(
             model=self.model_name,
             content=text,
-            task_type="retrieval_query"
+            task_type="retrieval_document"
             )
         return response["embedding"]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # One retrieval_query request per batch instead of one per query
+        embeddings = []
+        for batch in partition_texts(texts, self.batch_size, MAX_BATCH_BYTES):
+            response = genai.embed_content(
+                model=self.model_name,
+                content=batch,
+                task_type="retrieval_query"
+                )
+            embeddings.extend(response["embedding"])
+        return normalize_rows(embeddings) if self.normalize else embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = list(_embed_query(self.model_name, text))
+        return normalize_rows([embedding])[0] if self.normalize else embedding
     
\ No newline at end of file
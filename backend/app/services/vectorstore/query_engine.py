@@ -1,95 +1,390 @@
 import os
 import re
+import time
+import asyncio
 import logging
 import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
 from langchain_chroma import Chroma
-from backend.app.services.vectorstore.gemini_embeddings import GeminiEmbeddings
+from .gemini_embeddings import GeminiEmbeddings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 CHROMA_DB_PATH = "chroma_store"
+_PAGE_RE = re.compile(r"--- Page (\d+) ---")
+# Candidates fetched per requested result when diversifying with MMR
+MMR_FETCH_FACTOR = 4
+
+class SemanticQueryCache:
+    """Formatted query results, reused for repeated or near-identical queries.
+
+    Exact repeats are found by a hash of the query text; otherwise the query
+    embedding is compared against every cached embedding and a cosine
+    similarity of at least `threshold` counts as a hit. Results are only shared
+    between lookups with the same `scope` (an int or str such as top_k). Embeddings live as
+    unit-length rows of one preallocated float32 matrix, so a lookup is a
+    single matrix-vector product; evicted entries hand their row to the next insert.
+    """
+
+    def __init__(self, capacity: int = 512, threshold: float = 0.97, ttl: int = 600):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._slots: OrderedDict = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._keys: List[Optional[str]] = [None] * capacity
+        self._created_at = np.zeros(capacity)
+        self._scope = np.empty(capacity, dtype=object)
+        self._results: List[Optional[List[dict]]] = [None] * capacity
+
+    @staticmethod
+    def make_key(query: str, scope: Any) -> str:
+        # Whitespace differences alone never change the answer, so they share an entry
+        normalized = " ".join(query.split())
+        return hashlib.sha256(f"{scope}\0{normalized}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None and time.time() - self._created_at[slot] < self.ttl:
+                self._slots.move_to_end(key)
+                self.hits += 1
+                return self._results[slot]
+            return None
+
+    def get_similar(self, embedding: np.ndarray, scope: Any) -> Optional[List[dict]]:
+        with self._lock:
+            if not self._size or self._matrix.shape[1] != embedding.shape[0]:
+                self.misses += 1
+                return None
+            scores = self._matrix[:self._size] @ embedding
+            # Rule out rows for other scopes and expired entries before picking the best
+            scores[self._scope[:self._size] != scope] = -1.0
+            scores[time.time() - self._created_at[:self._size] >= self.ttl] = -1.0
+            slot = int(scores.argmax())
+            if scores[slot] < self.threshold or self._keys[slot] is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(self._keys[slot])
+            self.semantic_hits += 1
+            return self._results[slot]
+
+    def put(self, key: str, embedding: np.ndarray, scope: Any, results: List[dict]) -> None:
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+                self._reset(embedding.shape[0])
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                if self._size < self.capacity:
+                    slot = self._size
+                    self._size += 1
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                    self.evictions += 1
+            self._slots[key] = slot
+            self._matrix[slot] = embedding
+            self._keys[slot] = key
+            self._created_at[slot] = time.time()
+            self._scope[slot] = scope
+            self._results[slot] = results
+
+    def _reset(self, dimension: int) -> None:
+        self._slots.clear()
+        self._matrix = np.empty((self.capacity, dimension), dtype=np.float32)
+        self._size = 0
+        self._keys = [None] * self.capacity
+        self._results = [None] * self.capacity
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slots.clear()
+            self._size = 0
+            self._keys = [None] * self.capacity
+            self._results = [None] * self.capacity
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._slots),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+query_cache = SemanticQueryCache()
+
+STORE_MARKER = ".built"
+
+_VDB_LOCK = threading.Lock()
+_VDB: Optional[Chroma] = None
+_EMB: Optional[GeminiEmbeddings] = None
+_VDB_VERSION: Optional[int] = None
+_INDEX_READY = False
+
+def index_ready() -> bool:
+    # Once seen, the store only disappears during a rebuild, so skip the stat from then on
+    global _INDEX_READY
+    if not _INDEX_READY:
+        _INDEX_READY = os.path.exists(CHROMA_DB_PATH)
+    return _INDEX_READY
+
+def store_version() -> Optional[int]:
+    try:
+        return os.stat(os.path.join(CHROMA_DB_PATH, STORE_MARKER)).st_mtime_ns
+    except OSError:
+        return None
+
+def mark_store_built() -> None:
+    # Touched after every rebuild so other worker processes notice the new store
+    global _INDEX_READY
+    with open(os.path.join(CHROMA_DB_PATH, STORE_MARKER), "w"):
+        pass
+    _INDEX_READY = True
+
+def get_vectordb() -> Tuple[Chroma, GeminiEmbeddings]:
+    # Loaded once and shared, so queries reuse the open collection and its index
+    global _VDB, _EMB, _VDB_VERSION
+    version = store_version()
+    if _VDB is None or version != _VDB_VERSION:
+        with _VDB_LOCK:
+            if _VDB is None or version != _VDB_VERSION:
+                if _VDB is not None:
+                    logger.info("Vector store was rebuilt on disk, reloading it")
+                    query_cache.clear()
+                if _EMB is None:
+                    _EMB = GeminiEmbeddings()
+                _VDB = Chroma(
+                    persist_directory=CHROMA_DB_PATH,
+                    embedding_function=_EMB
+                )
+                _VDB_VERSION = version
+    return _VDB, _EMB
+
+def invalidate_vectordb() -> None:
+    global _VDB, _EMB, _INDEX_READY
+    with _VDB_LOCK:
+        _VDB = None
+        _EMB = None
+        _INDEX_READY = False
+    query_cache.clear()
+
+def normalize_embedding(embedding: List[Any]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
 
 def extract_page_info(text):
-    logger.info(f"Extracting page from text: {text[:100]}...")
-    page_match = re.search(r"--- Page (\d+) ---", text)
+    page_match = _PAGE_RE.search(text)
     if page_match:
-        page_num = int(page_match.group(1))
-        logger.info(f"Found page number: {page_num}")
-        return page_num
-    logger.info("No page number found in text")
+        return int(page_match.group(1))
     return None
 
-def extract_paragraph_info(text):
-    content_start = text.strip()[:50].strip()
-    hash_obj = hashlib.md5(content_start.encode())
-    paragraph_id = int(hash_obj.hexdigest()[:8], 16) % 100
-    return paragraph_id or 1
-
-def query_documents(query: str, top_k: int = 5):
-    if not os.path.exists(CHROMA_DB_PATH):
-        logger.warning(f"Chroma DB path does not exist: {CHROMA_DB_PATH}")
-        return [{
-            "matched_text": "No documents have been indexed yet. Please upload documents first.",
-            "filename": "System Message",
-            "citation": "System"
-        }]
+def distance_to_relevance(distance: float) -> float:
+    # The collection uses the "ip" space, where Chroma reports 1 - dot product;
+    # turn it back into a similarity so higher means more relevant
+    return 1.0 - float(distance)
+
+def format_result(text: str, metadata: Optional[dict], distance: float) -> dict:
+    metadata = metadata or {}
+    get = metadata.get
+    page_num = get('page') if 'page' in metadata else extract_page_info(text)
+    # 0-based index of the paragraph the chunk starts in, recorded at indexing time
+    paragraph_num = get('paragraph')
+    filename = get("filename", "Unknown")
+    
+    citation = f"{filename}"
+    if page_num:
+        citation += f", Page {page_num}"
+    if paragraph_num is not None:
+        citation += f", Para {paragraph_num + 1}"
+    
+    return {
+        "matched_text": text,
+        "filename": filename,
+        "citation": citation,
+        "page": page_num,
+        "paragraph": paragraph_num,
+        "relevance": distance_to_relevance(distance)
+    }
+
+def format_results(texts: List[str], metadatas: List[Optional[dict]], distances: List[float]) -> List[dict]:
+    formatted_results = [format_result(*hit) for hit in zip(texts, metadatas, distances)]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Formatted results: %s", formatted_results)
+    return formatted_results
+
+def search_vectors(vectordb: Chroma, embeddings: List[List[float]], top_k: int) -> List[List[dict]]:
+    # Query the chromadb collection directly and format its parallel arrays,
+    # skipping the per-hit Document objects the langchain wrapper builds
+    results = vectordb._collection.query(
+        query_embeddings=embeddings,
+        n_results=top_k,
+        include=["documents", "metadatas", "distances"]
+    )
+    return [
+        format_results(texts, metadatas, distances)
+        for texts, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"])
+    ]
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, top_k: int, lambda_mult: float) -> List[int]:
+    # Maximal marginal relevance over unit vectors: one similarity matrix, and each
+    # candidate's redundancy is a running max against the picks so far
+    k = min(top_k, len(candidates))
+    if not k:
+        return []
+    query_sims = candidates @ query
+    sims = candidates @ candidates.T
+    best = int(np.argmax(query_sims))
+    selected = [best]
+    available = np.ones(len(candidates), dtype=bool)
+    available[best] = False
+    redundancy = sims[:, best].copy()
+    while len(selected) < k:
+        scores = lambda_mult * query_sims - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, sims[:, best], out=redundancy)
+    return selected
+
+def search_vectors_mmr(vectordb: Chroma, embedding: List[float], top_k: int, lambda_mult: float) -> List[dict]:
+    results = vectordb._collection.query(
+        query_embeddings=[embedding],
+        n_results=top_k * MMR_FETCH_FACTOR,
+        include=["documents", "metadatas", "distances", "embeddings"]
+    )
+    candidates = np.asarray(results["embeddings"][0], dtype=np.float32)
+    selected = mmr_select(normalize_embedding(embedding), candidates, top_k, lambda_mult)
+    texts, metadatas, distances = results["documents"][0], results["metadatas"][0], results["distances"][0]
+    return format_results(
+        [texts[i] for i in selected],
+        [metadatas[i] for i in selected],
+        [distances[i] for i in selected]
+    )
+
+def not_indexed_results() -> List[dict]:
+    logger.warning(f"Chroma DB path does not exist: {CHROMA_DB_PATH}")
+    return [{
+        "matched_text": "No documents have been indexed yet. Please upload documents first.",
+        "filename": "System Message",
+        "citation": "System"
+    }]
+
+QUERY_ERROR_RESULTS = [{
+    "matched_text": "Error querying vector database. Try uploading documents first.",
+    "filename": "System Error",
+    "citation": "System"
+}]
+
+def query_error_results() -> List[dict]:
+    # Called from an except block, so the traceback is logged with the message
+    logger.exception("Vector search failed")
+    return QUERY_ERROR_RESULTS
+
+def query_documents(query: str, top_k: int = 5, mmr: bool = False, lambda_mult: float = 0.5):
+    if not index_ready():
+        return not_indexed_results()
         
     try:
         logger.info(f"Processing query: {query}")
-        embedding_function = GeminiEmbeddings()
+        vectordb, embedding_function = get_vectordb()
+        scope = f"mmr:{top_k}:{lambda_mult}" if mmr else top_k
+        cache_key = query_cache.make_key(query, scope)
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        query_embedding = embedding_function.embed_query(query)
+        normalized = normalize_embedding(query_embedding)
+        cached = query_cache.get_similar(normalized, scope)
+        if cached is not None:
+            logger.info("Serving results cached for a semantically similar query")
+            return cached
         
-        vectordb = Chroma(
-            persist_directory=CHROMA_DB_PATH,
-            embedding_function=embedding_function
+        formatted_results = (
+            search_vectors_mmr(vectordb, query_embedding, top_k, lambda_mult) if mmr
+            else search_vectors(vectordb, [query_embedding], top_k)[0]
         )
+        logger.info(f"Found {len(formatted_results)} results for query")
+
+        query_cache.put(cache_key, normalized, scope, formatted_results)
+        return formatted_results
+    except Exception:
+        return query_error_results()
+
+def query_documents_batch(queries: List[str], top_k: int = 5) -> List[List[dict]]:
+    if not index_ready():
+        return [not_indexed_results() for _ in queries]
+    
+    try:
+        vectordb, embedding_function = get_vectordb()
+        keys = [query_cache.make_key(query, top_k) for query in queries]
+        results = [query_cache.get(key) for key in keys]
+        missing = [i for i, cached in enumerate(results) if cached is None]
+        if not missing:
+            return results
         
-        results = vectordb.similarity_search(query, k=top_k)
-        logger.info(f"Found {len(results)} results for query")
-
-        formatted_results = []
-        for i, result in enumerate(results):
-            logger.info(f"Processing result {i+1}/{len(results)}")
-            logger.info(f"Metadata: {result.metadata}")
-            
-            page_num = None
-            if 'page' in result.metadata:
-                page_num = result.metadata.get('page')
-                logger.info(f"Page number from metadata: {page_num}")
-            else:
-                page_num = extract_page_info(result.page_content)
-                logger.info(f"Page number from content: {page_num}")
-            
-            paragraph_num = None
-            if 'paragraph_id' in result.metadata:
-                paragraph_num = result.metadata.get('paragraph_id')
-                logger.info(f"Paragraph ID from metadata: {paragraph_num}")
+        # Only the cache misses are embedded, together in one request
+        pending = []
+        embeddings = embedding_function.embed_queries([queries[i] for i in missing])
+        for i, embedding in zip(missing, embeddings):
+            normalized = normalize_embedding(embedding)
+            cached = query_cache.get_similar(normalized, top_k)
+            if cached is not None:
+                results[i] = cached
             else:
-                filename = result.metadata.get("filename", "Unknown")
-                paragraph_num = extract_paragraph_info(result.page_content, filename)
-                logger.info(f"Paragraph ID calculated: {paragraph_num}")
-            
-            citation = f"{result.metadata.get('filename', 'Unknown')}"
-            if page_num:
-                citation += f", Page {page_num}"
-            if paragraph_num:
-                citation += f", Para {paragraph_num}"
-            
-            formatted_result = {
-                "matched_text": result.page_content,
-                "filename": result.metadata.get("filename", "Unknown"),
-                "citation": citation,
-                "page": page_num,
-                "paragraph": paragraph_num
-            }
-            logger.info(f"Formatted result: {formatted_result}")
-            formatted_results.append(formatted_result)
+                pending.append((i, embedding, normalized))
+        
+        if pending:
+            searched = search_vectors(vectordb, [embedding for _, embedding, _ in pending], top_k)
+            for (i, _, normalized), formatted_results in zip(pending, searched):
+                results[i] = formatted_results
+                query_cache.put(keys[i], normalized, top_k, results[i])
+        logger.info(f"Searched {len(pending)} of {len(queries)} queries, the rest came from cache")
+        return results
+    except Exception:
+        error = query_error_results()
+        return [error for _ in queries]
+
+async def query_documents_async(query: str, top_k: int = 5, mmr: bool = False, lambda_mult: float = 0.5):
+    # Same flow as query_documents, with the Gemini call and the index search off the event loop
+    if not index_ready():
+        return not_indexed_results()
+        
+    try:
+        logger.info(f"Processing query: {query}")
+        vectordb, embedding_function = await asyncio.to_thread(get_vectordb)
+        scope = f"mmr:{top_k}:{lambda_mult}" if mmr else top_k
+        cache_key = query_cache.make_key(query, scope)
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        query_embedding = await asyncio.to_thread(embedding_function.embed_query, query)
+        normalized = normalize_embedding(query_embedding)
+        cached = query_cache.get_similar(normalized, scope)
+        if cached is not None:
+            logger.info("Serving results cached for a semantically similar query")
+            return cached
+        
+        formatted_results = (
+            await asyncio.to_thread(search_vectors_mmr, vectordb, query_embedding, top_k, lambda_mult) if mmr
+            else (await asyncio.to_thread(search_vectors, vectordb, [query_embedding], top_k))[0]
+        )
+        logger.info(f"Found {len(formatted_results)} results for query")
 
+        query_cache.put(cache_key, normalized, scope, formatted_results)
         return formatted_results
-    except Exception as e:
-        logger.error(f"Error querying vector database: {str(e)}", exc_info=True)
-        return [{
-            "matched_text": f"Error querying vector database: {str(e)}. Try uploading documents first.",
-            "filename": "System Error",
-            "citation": "System"
-        }]
+    except Exception:
+        return query_error_results()
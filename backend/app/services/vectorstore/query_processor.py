@@ -1,74 +1,313 @@
+import os
+import asyncio
 import re
-import json
+import time
+import random
+import orjson
 import logging
+import multiprocessing
+import threading
 import requests
-from typing import List, Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter
+from functools import lru_cache, partial
+from heapq import nlargest
+from itertools import chain
+from string import Template
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
-from app.config import SessionLocal
+from app.config import AsyncSessionLocal
 from app.models.document import Document
-from app.services.text_analysis import TextAnalyzer
+from app.services.text_analysis import TextAnalyzer, analyze_document_cached, generate_text_id
+from app.services.vectorstore.gemini_embeddings import GeminiEmbeddings
+from app.services.vectorstore.query_engine import SemanticQueryCache, index_ready, normalize_embedding, query_documents
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-def process_query(query: str, document_ids: Optional[List[int]] = None, relevance_threshold: float = 0.7, advanced_mode: bool = False, citation_level: str = "paragraph") -> List[Dict[str, Any]]:
+SEARCH_WORKERS = 5
+PROMPT_CONTENT_CHARS = 8000
+VECTOR_TOP_K = 20
+READ_WORKERS = 16
+RESPONSE_CACHE_THRESHOLD = 0.95
+RESPONSE_CACHE_TTL = 300
+PARALLEL_SEARCH_THRESHOLD = 8
+SCORE_WORKERS = min(os.cpu_count() or 1, 8)
+PROMPT_TEXT_CACHE_SIZE = 256
+
+# Citation fallbacks applied to every item the model returns; paragraph and page
+# references share one pattern so a citation is scanned once
+_CITATION_RE = re.compile(r'para(?:graph)?\s*(?P<paragraph>\d+)|page\s*(?P<page>\d+)')
+_SECTION_RE = re.compile(r'^\s*(\d+)\s+')
+# Markdown code fence the model may wrap its JSON in, stripped in one pass
+_FENCE_RE = re.compile(r'^\s*(?:```(?:json)?)?\s*(?P<body>.*?)\s*(?:```)?\s*$', re.DOTALL)
+
+# Caps in-flight Gemini calls across all concurrent searches, not just within one query
+_GEMINI_SLOTS = threading.BoundedSemaphore(settings.GEMINI_MAX_CONCURRENT_CALLS)
+
+# One pooled session keeps TLS connections to the Gemini API warm across searches
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["POST"])
+    )
+))
+
+# Searches only read these columns, so rows are fetched as plain tuples rather than ORM objects
+SEARCH_COLUMNS = (Document.id, Document.filename, Document.content_path, Document.filetype)
+
+# Gemini search results for repeated or near-identical queries over the same documents
+response_cache = SemanticQueryCache(threshold=RESPONSE_CACHE_THRESHOLD, ttl=RESPONSE_CACHE_TTL)
+query_embeddings = GeminiEmbeddings()
+_INFLIGHT: Dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+_SCORE_POOL: Optional[ProcessPoolExecutor] = None
+_SCORE_POOL_LOCK = threading.Lock()
+
+def _get_score_pool() -> ProcessPoolExecutor:
+    global _SCORE_POOL
+    if _SCORE_POOL is None:
+        with _SCORE_POOL_LOCK:
+            if _SCORE_POOL is None:
+                # spawn, not fork: the API process is multi-threaded
+                _SCORE_POOL = ProcessPoolExecutor(
+                    max_workers=SCORE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _SCORE_POOL
+
+async def load_search_documents(db: AsyncSession, document_ids: Optional[List[int]] = None) -> List[Any]:
+    # Pending uploads have no text yet and failed ones never will
+    stmt = select(*SEARCH_COLUMNS).where(Document.status == "ready")
+    if document_ids:
+        stmt = stmt.where(Document.id.in_(document_ids))
+    return (await db.execute(stmt)).all()
+
+async def process_query(query: str, document_ids: Optional[List[int]] = None, relevance_threshold: float = 0.7, advanced_mode: bool = False, citation_level: str = "paragraph", db: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
     logger.info(f"Processing query: '{query}' with citation_level: {citation_level}")
     if document_ids:
         logger.info(f"Restricting search to document IDs: {document_ids}")
     
-    db = SessionLocal()
-    try:
-        if document_ids:
-            documents = db.query(Document).filter(Document.id.in_(document_ids)).all()
-            if not documents:
-                logger.warning(f"No documents found for IDs: {document_ids}")
-                return []
-        else:
-            documents = db.query(Document).all()
-            
-        if not documents:
-            logger.warning("No documents available for search")
-            return []
-            
-        logger.info(f"Searching across {len(documents)} documents")
-        
-        if settings.GEMINI_API_KEY:
-            matches = search_with_gemini(query, documents, relevance_threshold, advanced_mode, citation_level)
-        else:
-            matches = basic_document_search(query, documents, citation_level)
+    # A caller's request-scoped session is reused; otherwise one is opened just for the lookup
+    if db is None:
+        async with AsyncSessionLocal() as db:
+            documents = await load_search_documents(db, document_ids)
+    else:
+        documents = await load_search_documents(db, document_ids)
+    if document_ids and not documents:
+        logger.warning(f"No documents found for IDs: {document_ids}")
+        return []
+    if not documents:
+        logger.warning("No documents available for search")
+        return []
         
-        logger.info(f"Found {len(matches)} relevant matches")
+    logger.info(f"Searching across {len(documents)} documents")
+    # File reads and Gemini calls block, so the search runs off the event loop
+    matches = await asyncio.to_thread(search_documents, query, documents, document_ids, relevance_threshold, advanced_mode, citation_level)
+    logger.info(f"Found {len(matches)} relevant matches")
+    return matches
+
+def search_documents(query: str, documents: List[Document], document_ids: Optional[List[int]], relevance_threshold: float, advanced_mode: bool, citation_level: str) -> List[Dict[str, Any]]:
+    if not settings.GEMINI_API_KEY:
+        return basic_document_search(query, documents, citation_level)
+    matches = None
+    if not document_ids:
+        # Retrieve chunks from the vector store instead of sending whole documents to the model
+        matches = search_vector_store(query, documents, relevance_threshold, advanced_mode, citation_level)
+    if matches is None:
+        matches = cached_search_with_gemini(query, documents, relevance_threshold, advanced_mode, citation_level)
+    return matches
+
+def top_matches(matches: List[Dict[str, Any]], limit: int = 10) -> List[Dict[str, Any]]:
+    # Same order as a stable descending sort, without sorting everything below the cut
+    return nlargest(limit, matches, key=lambda x: x.get("relevance", 0))
+
+def response_scope(documents: List[Document], relevance_threshold: float, advanced_mode: bool, citation_level: str) -> str:
+    doc_ids = ",".join(str(doc_id) for doc_id in sorted(doc.id for doc in documents))
+    return f"{doc_ids}|{relevance_threshold}|{advanced_mode}|{citation_level}"
+
+def cached_search_with_gemini(query: str, documents: List[Document], relevance_threshold: float, advanced_mode: bool, citation_level: str = "paragraph") -> List[Dict[str, Any]]:
+    scope = response_scope(documents, relevance_threshold, advanced_mode, citation_level)
+    cache_key = response_cache.make_key(query, scope)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Serving cached Gemini matches")
+        return cached
+    
+    # Identical queries arriving while one is in flight wait for its result instead of searching again
+    with _INFLIGHT_LOCK:
+        pending = _INFLIGHT.get(cache_key)
+        if pending is None:
+            _INFLIGHT[cache_key] = future = Future()
+    if pending is not None:
+        logger.info("Waiting for an identical in-flight Gemini search")
+        return pending.result()
+    
+    try:
+        matches = search_and_cache(query, documents, relevance_threshold, advanced_mode, citation_level, scope, cache_key)
+        future.set_result(matches)
         return matches
-        
+    except BaseException as e:
+        future.set_exception(e)
+        raise
     finally:
-        db.close()
+        with _INFLIGHT_LOCK:
+            del _INFLIGHT[cache_key]
 
-def search_with_gemini(query: str, documents: List[Document], relevance_threshold: float, advanced_mode: bool, citation_level: str = "paragraph") -> List[Dict[str, Any]]:
-    doc_contents = []
+def search_and_cache(query: str, documents: List[Document], relevance_threshold: float, advanced_mode: bool, citation_level: str, scope: str, cache_key: str) -> List[Dict[str, Any]]:
+    try:
+        embedding = normalize_embedding(query_embeddings.embed_query(query))
+    except Exception as e:
+        # Without an embedding only exact repeats can be served from the cache
+        logger.warning(f"Could not embed query for the response cache: {str(e)}")
+        embedding = None
+    if embedding is not None:
+        cached = response_cache.get_similar(embedding, scope)
+        if cached is not None:
+            logger.info("Serving Gemini matches cached for a semantically similar query")
+            return cached
+    
+    matches = search_with_gemini(query, documents, relevance_threshold, advanced_mode, citation_level)
+    # Failed Gemini calls also come back empty, so "no matches" is never cached
+    if embedding is not None and matches:
+        response_cache.put(cache_key, embedding, scope, matches)
+    return matches
+
+def search_vector_store(query: str, documents: List[Document], relevance_threshold: float, advanced_mode: bool, citation_level: str = "paragraph") -> Optional[List[Dict[str, Any]]]:
+    """Top chunks from the vector store mapped back to their documents, or None to fall back to full-document search"""
+    if not index_ready():
+        return None
+    
+    # Chunks carry the name of the text file they came from, which is the document's content_path
+    documents_by_file = {os.path.basename(doc.content_path): doc for doc in documents}
+    matches = []
+    for hit in query_documents(query, top_k=VECTOR_TOP_K):
+        doc = documents_by_file.get(hit["filename"])
+        if doc is None:
+            continue
+        matches.append({
+            "id": doc.id,
+            "filename": doc.filename,
+            "matched_text": hit["matched_text"],
+            "page": hit["page"],
+            "paragraph": hit["paragraph"],
+            "relevance": hit["relevance"],
+            "citation": hit["citation"].replace(hit["filename"], doc.filename, 1)
+        })
+    if not matches:
+        return None
+    
+    if advanced_mode:
+        matches = rerank_chunks(query, matches, relevance_threshold)
+    else:
+        # Without reranking, relevance is the chunk's embedding similarity to the query
+        matches = [match for match in matches if match["relevance"] >= relevance_threshold]
+    if not matches:
+        # No chunk cleared the threshold; the full-document search may still find something
+        return None
+    return cite_chunks(top_matches(matches), documents, citation_level)
+
+def cite_chunks(matches: List[Dict[str, Any]], documents: List[Document], citation_level: str) -> List[Dict[str, Any]]:
+    """Bring vector-store citations to the requested level; chunks already carry page and paragraph"""
+    if citation_level == "document":
+        for match in matches:
+            match["citation"] = match["filename"]
+        return matches
+    if citation_level != "sentence" or not matches:
+        return matches
+    
+    matched_ids = {match["id"] for match in matches}
+    analyzed = []
     for doc in documents:
+        if doc.id not in matched_ids:
+            continue
         try:
-            with open(doc.content_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            # Analyze for paragraph/sentence if needed
-            analysis = None
-            if citation_level in ["paragraph", "sentence"]:
-                analysis = TextAnalyzer.analyze_document(doc.id, content)
-            doc_contents.append({
-                "id": doc.id,
-                "filename": doc.filename,
-                "content": content,
-                "filetype": doc.filetype,
-                "analysis": analysis
-            })
+            analysis = analyze_document_cached(doc.id, doc.content_path, os.stat(doc.content_path).st_mtime_ns)
         except Exception as e:
-            logger.error(f"Error reading document {doc.id}: {str(e)}")
-    
-    if not doc_contents:
-        logger.warning("No document contents available for search")
-        return []
+            logger.error(f"Error analyzing document {doc.id}: {str(e)}")
+            continue
+        analyzed.append({"id": doc.id, "analysis": analysis})
+    return enhance_matches_with_citation_info(matches, analyzed, citation_level)
+
+def rerank_chunks(query: str, matches: List[Dict[str, Any]], relevance_threshold: float) -> List[Dict[str, Any]]:
+    system_prompt = "You are a research assistant that ranks retrieved passages by how well they answer a query."
+    passages = "".join(f"\nPASSAGE {i}:\n{match['matched_text']}\n---\n" for i, match in enumerate(matches))
+    user_prompt = f"""Query: "{query}"
+
+Rate how relevant each passage is to the query, from 0.0 to 1.0.
+Format as JSON: [{{"passage": passage_number (as integer), "relevance": relevance_score}}]
+Only return the JSON array.
+{passages}"""
+    try:
+        ratings = call_gemini_api(system_prompt, user_prompt)
+    except Exception as e:
+        logger.error(f"Error reranking passages: {str(e)}")
+        return matches
     
-    system_prompt = "You are a research assistant that helps find relevant information in documents."
+    reranked = []
+    for rating in ratings:
+        if not isinstance(rating, dict):
+            continue
+        index = rating.get("passage")
+        relevance = rating.get("relevance")
+        # The model may answer with strings or nulls; only numeric ratings are compared
+        if not isinstance(relevance, (int, float)):
+            continue
+        if isinstance(index, int) and 0 <= index < len(matches) and relevance >= relevance_threshold:
+            reranked.append({**matches[index], "relevance": relevance})
+    return reranked
+
+def read_documents(reader, documents: List[Document]) -> List[Any]:
+    # File reads are independent, so overlap their I/O waits
+    if len(documents) <= 1:
+        return [reader(doc) for doc in documents]
+    with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(documents))) as executor:
+        return list(executor.map(reader, documents))
 
+@lru_cache(maxsize=PROMPT_TEXT_CACHE_SIZE)
+def read_prompt_text(content_path: str, mtime_ns: int) -> Tuple[str, bool]:
+    # Only the start of each document reaches the prompt, so read no further than that;
+    # keyed on the modification time, so a re-uploaded file is read again
+    with open(content_path, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read(PROMPT_CONTENT_CHARS + 1)
+    truncated = len(content) > PROMPT_CONTENT_CHARS
+    if truncated:
+        content = content[:PROMPT_CONTENT_CHARS]
+    return content, truncated
+
+def load_prompt_document(doc: Document, citation_level: str) -> Optional[Dict[str, Any]]:
+    try:
+        mtime_ns = os.stat(doc.content_path).st_mtime_ns
+        content, truncated = read_prompt_text(doc.content_path, mtime_ns)
+        # Only the prompt is truncated; citations can point anywhere in the document,
+        # so paragraph/sentence analysis covers the whole file
+        analysis = None
+        if citation_level in ["paragraph", "sentence"]:
+            analysis = analyze_document_cached(doc.id, doc.content_path, mtime_ns)
+        return {
+            "id": doc.id,
+            "filename": doc.filename,
+            "content": content,
+            "truncated": truncated,
+            "filetype": doc.filetype,
+            "analysis": analysis
+        }
+    except Exception as e:
+        logger.error(f"Error reading document {doc.id}: {str(e)}")
+        return None
+
+@lru_cache(maxsize=16)
+def search_prompt_template(relevance_threshold: float, advanced_mode: bool, citation_level: str) -> Template:
+    """The user prompt for a search, with only the query left to fill in."""
     # Add citation level to the prompt
     citation_instruction = ""
     if citation_level == "paragraph":
@@ -78,7 +317,7 @@ def search_with_gemini(query: str, documents: List[Document], relevance_threshol
 
     if advanced_mode:
         user_prompt_template = f"""I need to find information across multiple documents related to this query:
-    "{query}"
+    "$query"
 
     For each document, analyze the content and extract only the most relevant sections that directly answer the query.
     Only include text that is truly relevant with a confidence level of at least {relevance_threshold * 100}%.
@@ -110,7 +349,7 @@ def search_with_gemini(query: str, documents: List[Document], relevance_threshol
         
     else:
         user_prompt_template = f"""Find relevant information in the following documents for this query:
-    "{query}"
+    "$query"
 
     Return only sections that are directly relevant to the query with a confidence of at least {relevance_threshold * 100}%.
     {citation_instruction}
@@ -129,39 +368,70 @@ def search_with_gemini(query: str, documents: List[Document], relevance_threshol
     IMPORTANT: Always include the paragraph number as a numeric value. If the section starts with a number (like "2 Background"), use that as the paragraph/section number.
     The paragraph and page fields must be numeric values (not strings).
     Only return the JSON array. Include at most 10 most relevant matches."""
+    return Template(user_prompt_template)
+
+def search_with_gemini(query: str, documents: List[Document], relevance_threshold: float, advanced_mode: bool, citation_level: str = "paragraph") -> List[Dict[str, Any]]:
+    loaded = read_documents(lambda doc: load_prompt_document(doc, citation_level), documents)
+    doc_contents = [doc for doc in loaded if doc is not None]
     
-    matches = []
-    chunk_size = 5      
+    if not doc_contents:
+        logger.warning("No document contents available for search")
+        return []
     
-    for i in range(0, len(doc_contents), chunk_size):
-        chunk = doc_contents[i:i + chunk_size]
-        docs_prompt = "\n\nDocuments to search:\n"
+    system_prompt = "You are a research assistant that helps find relevant information in documents."
 
-        for doc in chunk:
-            content = doc["content"]
-            if len(content) > 8000:
-                content = content[:8000] + "... [content truncated]"
-            docs_prompt += f"\nDOCUMENT ID: {doc['id']}, FILENAME: {doc['filename']}\n{content}\n---\n"
+    user_prompt_template = search_prompt_template(relevance_threshold, advanced_mode, citation_level).substitute(query=query)
+    
+    chunk_size = 5      
+    chunks = [doc_contents[i:i + chunk_size] for i in range(0, len(doc_contents), chunk_size)]
 
-        full_prompt = user_prompt_template + docs_prompt
+    def search_chunk(index: int) -> List[Dict[str, Any]]:
+        chunk = chunks[index]
+        parts = [user_prompt_template, "\n\nDocuments to search:\n"]
+        for doc in chunk:
+            parts.append(
+                f"\nDOCUMENT ID: {doc['id']}, FILENAME: {doc['filename']}\n{doc['content']}"
+                f"{'... [content truncated]' if doc['truncated'] else ''}\n---\n"
+            )
+        full_prompt = "".join(parts)
         
         try:
-            logger.info(f"Calling Gemini API for search (chunk {i // chunk_size + 1}/{(len(doc_contents) + chunk_size - 1) // chunk_size})")
+            if index:
+                # Stagger concurrent requests so they do not all land on the API at once
+                time.sleep(random.random() * 0.1)
+            logger.info(f"Calling Gemini API for search (chunk {index + 1}/{len(chunks)})")
             chunk_matches = call_gemini_api(system_prompt, full_prompt)
             # Enhance matches with more detailed citation information
             chunk_matches = enhance_matches_with_citation_info(chunk_matches, chunk, citation_level)
-            chunk_matches = [m for m in chunk_matches if m.get("relevance", 0) >= relevance_threshold]
-            matches.extend(chunk_matches)
+            return [m for m in chunk_matches if m.get("relevance", 0) >= relevance_threshold]
         except Exception as e:
-            logger.error(f"Error searching chunk {i // chunk_size + 1}: {str(e)}")
+            logger.error(f"Error searching chunk {index + 1}: {str(e)}")
+            return []
+    
+    matches = []
+    with ThreadPoolExecutor(max_workers=min(SEARCH_WORKERS, len(chunks))) as executor:
+        # map keeps chunk order, so ties in relevance sort the same way as a sequential run
+        for chunk_matches in executor.map(search_chunk, range(len(chunks))):
+            matches.extend(chunk_matches)
     
-    matches.sort(key=lambda x: x.get("relevance", 0), reverse=True)
-    return matches[:10]
+    return top_matches(matches)
+
+def citation_index(analysis: Dict[str, Any]) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, List[Dict[str, Any]]]]:
+    paragraphs_by_index = {para["index"]: para for para in analysis["paragraphs"]}
+    sentences_by_paragraph = {}
+    for sent in analysis["sentences"]:
+        sentences_by_paragraph.setdefault(sent["paragraph_index"], []).append(sent)
+    return paragraphs_by_index, sentences_by_paragraph
 
 def enhance_matches_with_citation_info(matches: List[Dict[str, Any]], documents: List[Dict[str, Any]], citation_level: str) -> List[Dict[str, Any]]:
     """Enhance matches with detailed citation information based on TextAnalyzer results"""
     if citation_level == "document":
         return matches
+    
+    # Documents and their paragraph/sentence lookups are indexed once per call, not per match
+    docs_by_id = {d["id"]: d for d in documents}
+    indexes = {}
+    sentence_words = {}
         
     for match in matches:
         doc_id = match.get("id")
@@ -169,9 +439,12 @@ def enhance_matches_with_citation_info(matches: List[Dict[str, Any]], documents:
             continue
             
         # Find the document in our processed documents
-        doc = next((d for d in documents if d["id"] == doc_id), None)
+        doc = docs_by_id.get(doc_id)
         if not doc or not doc.get("analysis"):
             continue
+        if doc_id not in indexes:
+            indexes[doc_id] = citation_index(doc["analysis"])
+        paragraphs_by_index, sentences_by_paragraph = indexes[doc_id]
             
         matched_text = match.get("matched_text", "")
         if not matched_text:
@@ -184,14 +457,11 @@ def enhance_matches_with_citation_info(matches: List[Dict[str, Any]], documents:
         # For paragraph-level citations
         if citation_level in ["paragraph", "sentence"]:
             # Try to find the paragraph by index
-            if paragraph_num is not None:
-                paragraphs = doc["analysis"]["paragraphs"]
-                for para in paragraphs:
-                    if para["index"] == paragraph_num:
-                        paragraph_id = para["id"]
-                        match["paragraph_id"] = paragraph_id
-                        match["position"] = para["position"]
-                        break
+            para = paragraphs_by_index.get(paragraph_num) if paragraph_num is not None else None
+            if para is not None:
+                paragraph_id = para["id"]
+                match["paragraph_id"] = paragraph_id
+                match["position"] = para["position"]
                 
             # If not found by index, try content matching
             if not paragraph_id:
@@ -219,7 +489,7 @@ def enhance_matches_with_citation_info(matches: List[Dict[str, Any]], documents:
         # For sentence-level citations
         if citation_level == "sentence" and paragraph_id:
             # Find sentences in this paragraph
-            sentences = [s for s in doc["analysis"]["sentences"] if s["paragraph_index"] == paragraph_num]
+            sentences = sentences_by_paragraph.get(paragraph_num, [])
             
             # Try to find exact sentence match
             sentence_found = False
@@ -247,10 +517,13 @@ def enhance_matches_with_citation_info(matches: List[Dict[str, Any]], documents:
                 best_match = sentences[0]
                 best_score = 0
                 matched_words = set(matched_text.lower().split())
+                # Each paragraph's sentence word sets are built once and shared by later matches
+                words_key = (doc_id, paragraph_num)
+                if words_key not in sentence_words:
+                    sentence_words[words_key] = [frozenset(sent["content"].lower().split()) for sent in sentences]
                 
-                for sent in sentences:
-                    sent_words = set(sent["content"].lower().split())
-                    overlap = len(matched_words.intersection(sent_words))
+                for sent, sent_words in zip(sentences, sentence_words[words_key]):
+                    overlap = len(matched_words & sent_words)
                     if overlap > best_score:
                         best_score = overlap
                         best_match = sent
@@ -270,6 +543,23 @@ def enhance_matches_with_citation_info(matches: List[Dict[str, Any]], documents:
     
     return matches
 
+@lru_cache(maxsize=4096)
+def parse_citation(citation: str) -> Tuple[Optional[int], Optional[int]]:
+    """First paragraph and page numbers referenced in a citation string.
+
+    Memoized, since the same citations recur across chunks and repeated queries.
+    """
+    paragraph = page = None
+    for match in _CITATION_RE.finditer(citation.lower()):
+        if match.lastgroup == "paragraph":
+            if paragraph is None:
+                paragraph = int(match.group("paragraph"))
+        elif page is None:
+            page = int(match.group("page"))
+        if paragraph is not None and page is not None:
+            break
+    return paragraph, page
+
 def call_gemini_api(system_prompt: str, user_prompt: str) -> List[Dict[str, Any]]:
     url = f"https://generativelanguage.googleapis.com/v1beta/models/{settings.MODEL_NAME}:generateContent?key={settings.GEMINI_API_KEY}"
     headers = {
@@ -291,40 +581,36 @@ def call_gemini_api(system_prompt: str, user_prompt: str) -> List[Dict[str, Any]
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        with _GEMINI_SLOTS:
+            response = _SESSION.post(url, headers=headers, data=orjson.dumps(data), timeout=(3.05, 120))
         response.raise_for_status()
-        response_data = response.json()
+        response_data = orjson.loads(response.content)
 
         raw_content = response_data["candidates"][0]["content"]["parts"][0]["text"]
 
-        cleaned = raw_content.strip()
-        if cleaned.startswith("```json"):
-            cleaned = cleaned[len("```json"):].strip()
-        elif cleaned.startswith("```"):
-            cleaned = cleaned[len("```"):].strip()
-        if cleaned.endswith("```"):
-            cleaned = cleaned[:-3].strip()
+        cleaned = _FENCE_RE.match(raw_content).group("body")
 
-        result = json.loads(cleaned)
+        result = orjson.loads(cleaned)
 
         if isinstance(result, list):
             for item in result:
-                if "paragraph" not in item or item["paragraph"] is None:
-                    if "citation" in item and "para" in item["citation"].lower():
-                        para_match = re.search(r'para(?:graph)?\s*(\d+)', item["citation"].lower())
-                        if para_match:
-                            item["paragraph"] = int(para_match.group(1)) - 1  # Convert to zero-based index
+                needs_paragraph = "paragraph" not in item or item["paragraph"] is None
+                needs_page = "page" not in item or item["page"] is None
+                cited_paragraph = cited_page = None
+                if (needs_paragraph or needs_page) and isinstance(item.get("citation"), str):
+                    cited_paragraph, cited_page = parse_citation(item["citation"])
+                
+                if needs_paragraph:
+                    if cited_paragraph is not None:
+                        item["paragraph"] = cited_paragraph - 1  # Convert to zero-based index
                     
                     matched_text = item.get("matched_text", "")
-                    section_match = re.match(r'^\s*(\d+)\s+', matched_text)
+                    section_match = _SECTION_RE.match(matched_text)
                     if section_match and "paragraph" not in item:
                         item["paragraph"] = int(section_match.group(1)) - 1  # Convert to zero-based index
                 
-                if "page" not in item or item["page"] is None:
-                    if "citation" in item and "page" in item["citation"].lower():
-                        page_match = re.search(r'page\s*(\d+)', item["citation"].lower())
-                        if page_match:
-                            item["page"] = int(page_match.group(1))
+                if needs_page and cited_page is not None:
+                    item["page"] = cited_page
                 
                 filename = item.get("filename", "Unknown document")
                 paragraph = item.get("paragraph")
@@ -351,71 +637,118 @@ def call_gemini_api(system_prompt: str, user_prompt: str) -> List[Dict[str, Any]
     except requests.exceptions.RequestException as e:
         logger.error(f"API request error: {str(e)}")
         raise
-    except (json.JSONDecodeError, KeyError) as e:
+    except (orjson.JSONDecodeError, KeyError) as e:
         logger.error(f"Error parsing API response: {str(e)}")
         logger.error(f"Response content: {raw_content if 'raw_content' in locals() else 'N/A'}")
         return []
 
-def basic_document_search(query: str, documents: List[Document], citation_level: str = "paragraph") -> List[Dict[str, Any]]:
+def term_relevance(text: str, term_counts: Tuple[Tuple[str, int], ...]) -> float:
+    text = text.lower()
+    hits = 0
+    for term, count in term_counts:
+        if term in text:
+            hits += count
+            # Relevance is capped at 1.0, so further terms cannot change the result
+            if hits >= 10:
+                break
+    return 0.1 * hits
+
+def score_document(doc_id: int, filename: str, content: str, term_counts: Tuple[Tuple[str, int], ...], citation_level: str) -> List[Dict[str, Any]]:
     matches = []
-    query_terms = query.lower().split()
+    if citation_level == "document":
+        relevance = term_relevance(content, term_counts)
+        if relevance >= 0.2:
+            matches.append({
+                "id": doc_id,
+                "filename": filename,
+                "matched_text": content[:200] + "...",
+                "relevance": min(relevance, 1.0),
+                "citation": filename
+            })
+    elif citation_level == "paragraph":
+        # Paragraphs are scored as they are found; only matches get an id
+        for para in TextAnalyzer.iter_paragraphs(content):
+            para_text = para["content"]
+            relevance = term_relevance(para_text, term_counts)
+            if relevance >= 0.2:
+                matches.append({
+                    "id": doc_id,
+                    "filename": filename,
+                    "matched_text": para_text,
+                    "paragraph": para["index"],
+                    "paragraph_id": generate_text_id(para_text),
+                    "relevance": min(relevance, 1.0),
+                    "citation": f"{filename}, Para {para['index']+1}",
+                    "position": para["position"]
+                })
+    elif citation_level == "sentence":
+        matches = score_sentences(doc_id, filename, TextAnalyzer.analyze_document(doc_id, content), term_counts)
+    return matches
 
-    for doc in documents:
-        try:
-            with open(doc.content_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            analysis = TextAnalyzer.analyze_document(doc.id, content)
-            if citation_level == "document":
-                relevance = 0
-                for term in query_terms:
-                    if term in content.lower():
-                        relevance += 0.1
-                if relevance >= 0.2:
-                    matches.append({
-                        "id": doc.id,
-                        "filename": doc.filename,
-                        "matched_text": content[:200] + "...",
-                        "relevance": min(relevance, 1.0),
-                        "citation": doc.filename
-                    })
-            elif citation_level == "paragraph":
-                for para in analysis["paragraphs"]:
-                    para_text = para["content"]
-                    relevance = 0
-                    for term in query_terms:
-                        if term in para_text.lower():
-                            relevance += 0.1
-                    if relevance >= 0.2:
-                        matches.append({
-                            "id": doc.id,
-                            "filename": doc.filename,
-                            "matched_text": para_text,
-                            "paragraph": para["index"],
-                            "paragraph_id": para["id"],
-                            "relevance": min(relevance, 1.0),
-                            "citation": f"{doc.filename}, Para {para['index']+1}",
-                            "position": para["position"]
-                        })
-            elif citation_level == "sentence":
-                for sent in analysis["sentences"]:
-                    sent_text = sent["content"]
-                    relevance = 0
-                    for term in query_terms:
-                        if term in sent_text.lower():
-                            relevance += 0.1
-                    if relevance >= 0.2:
-                        matches.append({
-                            "id": doc.id,
-                            "filename": doc.filename,
-                            "matched_text": sent_text,
-                            "paragraph": sent["paragraph_index"],
-                            "sentence": sent["index"],
-                            "sentence_id": sent["id"],
-                            "relevance": min(relevance, 1.0),
-                            "citation": f"{doc.filename}, Para {sent['paragraph_index']+1}, Sentence {sent['index']+1}",
-                            "position": sent["position"]
-                        })
-        except Exception as e:
-            logger.error(f"Error processing document {doc.id}: {str(e)}")
-    matches.sort(key=lambda x: x.get("relevance", 0), reverse=True)
-    return matches[:10]
\ No newline at end of file
+def score_sentences(doc_id: int, filename: str, analysis: Dict[str, Any], term_counts: Tuple[Tuple[str, int], ...]) -> List[Dict[str, Any]]:
+    matches = []
+    for sent in analysis["sentences"]:
+        sent_text = sent["content"]
+        relevance = term_relevance(sent_text, term_counts)
+        if relevance >= 0.2:
+            matches.append({
+                "id": doc_id,
+                "filename": filename,
+                "matched_text": sent_text,
+                "paragraph": sent["paragraph_index"],
+                "sentence": sent["index"],
+                "sentence_id": sent["id"],
+                "relevance": min(relevance, 1.0),
+                "citation": f"{filename}, Para {sent['paragraph_index']+1}, Sentence {sent['index']+1}",
+                "position": sent["position"]
+            })
+    return matches
+
+def score_document_bytes(doc_id: int, filename: str, content_path: str, term_counts: Tuple[Tuple[str, int], ...]) -> List[Dict[str, Any]]:
+    # ASCII terms match the same on lowercased UTF-8 bytes, so only the preview is ever decoded
+    with open(content_path, 'rb') as f:
+        data = f.read()
+    relevance = term_relevance(data, tuple((term.encode(), count) for term, count in term_counts))
+    if relevance < 0.2:
+        return []
+    # 200 characters take at most 800 bytes
+    preview = data[:800].decode('utf-8', errors='replace')[:200]
+    return [{
+        "id": doc_id,
+        "filename": filename,
+        "matched_text": preview + "...",
+        "relevance": min(relevance, 1.0),
+        "citation": filename
+    }]
+
+def _search_document(doc_fields: Tuple[int, str, str], term_counts: Tuple[Tuple[str, int], ...], citation_level: str) -> List[Dict[str, Any]]:
+    # Runs in a worker, so with processes the file is read there rather than pickled across
+    doc_id, filename, content_path = doc_fields
+    try:
+        if citation_level == "sentence":
+            analysis = analyze_document_cached(doc_id, content_path, os.stat(content_path).st_mtime_ns)
+            return score_sentences(doc_id, filename, analysis, term_counts)
+        if citation_level == "document" and all(term.isascii() for term, _ in term_counts):
+            return score_document_bytes(doc_id, filename, content_path, term_counts)
+        with open(content_path, 'r', encoding='utf-8', buffering=1 << 20) as f:
+            content = f.read()
+        return score_document(doc_id, filename, content, term_counts, citation_level)
+    except Exception as e:
+        logger.error(f"Error processing document {doc_id}: {str(e)}")
+        return []
+
+def basic_document_search(query: str, documents: List[Document], citation_level: str = "paragraph") -> List[Dict[str, Any]]:
+    # Each distinct term is searched once per text, weighted by how often it occurs in the query
+    term_counts = tuple(Counter(query.lower().split()).items())
+    search = partial(_search_document, term_counts=term_counts, citation_level=citation_level)
+    doc_fields = [(doc.id, doc.filename, doc.content_path) for doc in documents]
+
+    if len(documents) >= PARALLEL_SEARCH_THRESHOLD:
+        # Scoring is pure-Python CPU work, so large document sets are spread over the
+        # long-lived worker processes, which also keep their analyses cached between queries
+        matches = list(chain.from_iterable(_get_score_pool().map(search, doc_fields)))
+    else:
+        # A few documents are not worth the pool round trip; threads still overlap the reads
+        with ThreadPoolExecutor(max_workers=max(1, min(READ_WORKERS, len(documents)))) as executor:
+            matches = list(chain.from_iterable(executor.map(search, doc_fields)))
+    return top_matches(matches)
\ No newline at end of file
@@ -1,10 +1,17 @@
+import os
 import uvicorn
 
+# Each worker is its own process with its own DB pool (DB_POOL_SIZE is per worker),
+# caches and loaded vector store; a rebuild after an upload only refreshes the worker
+# that ran it, so raise WORKERS for read-heavy deployments
+WORKERS = int(os.getenv("WORKERS", "1"))
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app", 
         host="0.0.0.0", 
         port=8000, 
+        workers=WORKERS,
         timeout_keep_alive=120,  # Increase keep-alive timeout to 2 minutes
         limit_concurrency=10,    # Limit concurrent connections
         backlog=100              # Allow more pending connections
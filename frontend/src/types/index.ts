@@ -4,6 +4,7 @@ export interface Document {
   filetype: string;
   uploaded_at: string;
   content_path?: string;
+  status?: "pending" | "ready" | "failed";
   content?: string;
   pages?: number;
   metadata?: {
@@ -13,59 +13,82 @@ if os.path.exists(dotenv_path):
 
 os.environ.setdefault("TESTING", "True")
 
-from backend.app.config import SessionLocal
+# Backend modules are imported inside the fixtures that need them, so collecting
+# tests that never touch the database or the app skips the SQLAlchemy/Gemini imports
+
+@pytest.fixture(scope="session")
+def create_tables():
+    # The app creates tables in its lifespan, which TestClient only runs as a context manager
+    from backend.app.config import engine
+    from backend.app.models.document import Base, ensure_document_columns
+    Base.metadata.create_all(bind=engine)
+    ensure_document_columns(engine)
+
+@pytest.fixture(scope="session")
+def client(create_tables):
+    # One client for the whole run, so the app starts up once rather than per test module
+    from fastapi.testclient import TestClient
+    from backend.app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
 
 @pytest.fixture
-def db_session():
+def db_session(create_tables):
+    from backend.app.config import SessionLocal
     session = SessionLocal()
     try:
         yield session
     finally:
         session.close()
         
+ANALYZER_RESULT = {
+    "document_id": 1,
+    "paragraphs": [
+        {
+            "index": 0,
+            "content": "This is a test paragraph.",
+            "position": {"start": 0, "end": 25},
+            "id": "test_para_id",
+            "document_id": 1
+        }
+    ],
+    "sentences": [
+        {
+            "index": 0,
+            "paragraph_index": 0,
+            "content": "This is a test paragraph.",
+            "position": {"start": 0, "end": 25},
+            "id": "test_sent_id",
+            "document_id": 1
+        }
+    ],
+    "statistics": {
+        "paragraph_count": 1,
+        "sentence_count": 1
+    }
+}
+
+THEME_RESULT = {
+    "themes": [
+        {
+            "id": 1,
+            "theme_name": "Test Theme",
+            "summary": "This is a test theme.",
+            "supporting_documents": ["DOC001", "DOC002"],
+            "evidence": "Test evidence for the theme."
+        }
+    ]
+}
+
 @pytest.fixture
 def mock_text_analyzer():
+    # Tests that change the result should copy it first; it is shared across the run
     mock = MagicMock()
-    mock.analyze_document.return_value = {
-        "document_id": 1,
-        "paragraphs": [
-            {
-                "index": 0,
-                "content": "This is a test paragraph.",
-                "position": {"start": 0, "end": 25},
-                "id": "test_para_id",
-                "document_id": 1
-            }
-        ],
-        "sentences": [
-            {
-                "index": 0,
-                "paragraph_index": 0,
-                "content": "This is a test paragraph.",
-                "position": {"start": 0, "end": 25},
-                "id": "test_sent_id",
-                "document_id": 1
-            }
-        ],
-        "statistics": {
-            "paragraph_count": 1,
-            "sentence_count": 1
-        }
-    }
+    mock.analyze_document.return_value = ANALYZER_RESULT
     return mock
 
 @pytest.fixture
 def mock_theme_identifier():
     mock = MagicMock()
-    mock.identify_themes.return_value = {
-        "themes": [
-            {
-                "id": 1,
-                "theme_name": "Test Theme",
-                "summary": "This is a test theme.",
-                "supporting_documents": ["DOC001", "DOC002"],
-                "evidence": "Test evidence for the theme."
-            }
-        ]
-    }
+    mock.identify_themes.return_value = THEME_RESULT
     return mock 
\ No newline at end of file
@@ -2,13 +2,9 @@ import io
 import pytest
 import sys
 import os
-from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
-from backend.app.main import app
-
-client = TestClient(app)
 
 @pytest.fixture(autouse=True)
 def mock_document_service():
@@ -56,7 +52,7 @@ def mock_db():
         mock_get_db.return_value = session
         yield session
 
-def test_get_document_not_found():
+def test_get_document_not_found(client):
     with patch('backend.app.api.documents.DocumentService', autospec=True) as mock_cls:
         mock_service = mock_cls.return_value
         mock_service.get_document.return_value = None
@@ -75,7 +71,7 @@ def test_get_document_not_found():
             assert "detail" in data
             assert "not found" in data["detail"].lower()
 
-def test_upload_invalid_file_type():
+def test_upload_invalid_file_type(client):
     test_file_content = b"Not a PDF file"
     test_file = io.BytesIO(test_file_content)
     
@@ -88,4 +84,17 @@ def test_upload_invalid_file_type():
     
     data = response.json()
     assert "detail" in data
-    assert "unsupported file type" in data["detail"].lower() 
\ No newline at end of file
+    assert "unsupported file type" in data["detail"].lower() 
+
+def test_list_documents_not_modified(client):
+    response = client.get("/api/documents")
+    etag = response.headers.get("etag")
+    
+    assert response.status_code == 200
+    assert etag
+    assert response.headers["cache-control"] == "private, max-age=10"
+    
+    cached = client.get("/api/documents", headers={"If-None-Match": etag})
+    
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
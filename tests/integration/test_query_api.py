@@ -1,13 +1,8 @@
-from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
-from backend.app.main import app
-
-client = TestClient(app)
-
-def test_query_with_empty_query():
+def test_query_with_empty_query(client):
     # The API currently doesn't validate empty queries strictly
-    with patch('backend.app.api.query.process_query') as mock_processor:
+    with patch('backend.app.api.query.process_query', new_callable=AsyncMock) as mock_processor:
         mock_processor.return_value = []
         
         with patch('backend.app.api.query.get_db') as mock_get_db:
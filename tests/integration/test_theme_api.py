@@ -1,9 +1,5 @@
 import pytest
-from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
-from backend.app.main import app
-
-client = TestClient(app)
 
 @pytest.fixture
 def mock_db_session():
@@ -12,7 +8,7 @@ def mock_db_session():
         mock_get_db.return_value = mock_session
         yield mock_session
 
-def test_get_theme_citations(mock_db_session):
+def test_get_theme_citations(client, mock_db_session):
     theme_id = 1
     response = client.get(f"/api/themes/{theme_id}/citations?citation_level=paragraph")
     
@@ -37,7 +33,7 @@ def test_get_theme_citations(mock_db_session):
         assert "citation" in citation
         assert "paragraph_index" in citation
 
-def test_get_theme_citations_with_different_levels(mock_db_session):
+def test_get_theme_citations_with_different_levels(client, mock_db_session):
     theme_id = 1
     
     response = client.get(f"/api/themes/{theme_id}/citations?citation_level=document")
@@ -1,6 +1,7 @@
 import sys
 import os
-import subprocess
+import importlib.util
+import pytest
 from dotenv import load_dotenv
 
 def main():
@@ -28,11 +29,14 @@ def main():
 
     print("\nRunning tests for Redoc project...\n")
     
-    cmd = ["pytest", "-v", current_dir]
-    print(f"Executing: {' '.join(cmd)}")
-    result = subprocess.run(cmd)
+    # Run in this interpreter instead of a child process, and skip .pytest_cache I/O
+    args = ["-v", "-p", "no:cacheprovider", current_dir]
+    if importlib.util.find_spec("xdist"):
+        # Spread test files over all cores; loadfile keeps a module's tests on one worker
+        args[:0] = ["-n", "auto", "--dist", "loadfile"]
+    print(f"Executing: pytest {' '.join(args)}")
 
-    return result.returncode
+    return int(pytest.main(args))
 
 if __name__ == "__main__":
     sys.exit(main())
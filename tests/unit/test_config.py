@@ -0,0 +1,30 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.app.config import get_engine_options
+
+def test_only_in_memory_sqlite_shares_one_connection(tmp_path):
+    """Test that StaticPool is reserved for in-memory SQLite databases"""
+    assert get_engine_options("sqlite://")["poolclass"] is StaticPool
+    assert get_engine_options("sqlite:///:memory:")["poolclass"] is StaticPool
+    assert "poolclass" not in get_engine_options(f"sqlite:///{tmp_path / 'app.db'}")
+
+def test_file_sqlite_sessions_keep_their_own_transactions(tmp_path):
+    """Test that an uncommitted delete is neither seen nor rolled back by another session"""
+    database_url = f"sqlite:///{tmp_path / 'app.db'}"
+    engine = create_engine(database_url, **get_engine_options(database_url))
+    Session = sessionmaker(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO items (id) VALUES (1), (2)"))
+    
+    writer = Session()
+    writer.execute(text("DELETE FROM items WHERE id = 1"))
+    with Session() as reader:
+        assert reader.execute(text("SELECT count(*) FROM items")).scalar() == 2
+    writer.commit()
+    writer.close()
+    
+    with Session() as session:
+        assert session.execute(text("SELECT count(*) FROM items")).scalar() == 1
+    engine.dispose()
@@ -0,0 +1,68 @@
+from backend.app.services.vectorstore.document_indexing import iter_text_blocks
+
+def test_iter_text_blocks_splits_on_line_boundaries(tmp_path):
+    """Test that files are read in line-aligned blocks that reassemble the text"""
+    text = "".join(f"line {i}\n" for i in range(100))
+    path = tmp_path / "doc.txt"
+    path.write_text(text, encoding="utf-8")
+    
+    blocks = list(iter_text_blocks(str(path), "doc.txt", block_size=64))
+    
+    assert len(blocks) > 1
+    assert "".join(block.page_content for block in blocks) == text
+    assert all(block.page_content.endswith("\n") for block in blocks)
+    assert blocks[0].metadata == {"source": str(path), "filename": "doc.txt", "paragraph": 0}
+
+def test_assign_chunk_metadata_records_pages():
+    """Test that chunks carrying a page marker get its page number"""
+    from langchain_core.documents import Document as LCDocument
+    from backend.app.services.vectorstore.document_indexing import (
+        assign_chunk_metadata, extract_page_info
+    )
+    
+    docs = [
+        LCDocument(page_content="--- Page 3 ---\\nClimate policy text", metadata={"filename": "a.txt"}),
+        LCDocument(page_content="  No marker here  ", metadata={"filename": "b.txt"}),
+    ]
+    assign_chunk_metadata(docs)
+    
+    assert docs[0].metadata["page"] == extract_page_info(docs[0].page_content) == 3
+    assert "page" not in docs[1].metadata
+
+def test_chunks_record_the_paragraph_they_start_in(tmp_path):
+    """Test that chunk paragraph indexes agree with TextAnalyzer across block boundaries"""
+    from backend.app.services.text_analysis import TextAnalyzer
+    from backend.app.services.vectorstore.document_indexing import split_documents
+    
+    paragraphs = [" ".join(f"p{i}w{j}" for j in range(40 + i * 7)) for i in range(12)]
+    separators = ["\n\n", "\n\n\n", "\n\n\n\n", "\n\n \n\n"]
+    text = "".join(para + separators[i % len(separators)] for i, para in enumerate(paragraphs))
+    path = tmp_path / "doc.txt"
+    path.write_text(text, encoding="utf-8")
+    
+    blocks = list(iter_text_blocks(str(path), "doc.txt", block_size=300))
+    chunks = split_documents(blocks)
+    by_index = {para["index"]: para["content"] for para in TextAnalyzer.split_into_paragraphs(text)}
+    
+    assert len(blocks) > 1
+    assert all("start_index" not in chunk.metadata for chunk in chunks)
+    for chunk in chunks:
+        assert chunk.page_content[:20] in by_index[chunk.metadata["paragraph"]]
+    assert {chunk.metadata["paragraph"] for chunk in chunks} == set(by_index)
+
+def test_split_documents_in_process_pool_matches_sequential():
+    """Test that splitting across processes gives the same chunks in the same order"""
+    from unittest.mock import patch
+    from langchain_core.documents import Document as LCDocument
+    from backend.app.services.vectorstore import document_indexing
+    
+    docs = [
+        LCDocument(page_content=" ".join(f"word{i}-{j}" for j in range(300)), metadata={"filename": f"{i}.txt"})
+        for i in range(3)
+    ]
+    sequential = document_indexing.split_documents(docs)
+    with patch.object(document_indexing, "PARALLEL_SPLIT_CHARS", 1):
+        parallel = document_indexing.split_documents(docs)
+    
+    assert len(sequential) > len(docs)
+    assert [(d.page_content, d.metadata) for d in parallel] == [(d.page_content, d.metadata) for d in sequential]
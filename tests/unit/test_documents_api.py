@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from fastapi import HTTPException
+from backend.app.api import documents
+
+def test_delete_document_removes_the_file_after_commit(tmp_path):
+    """Test that the file is removed only once the row delete is committed"""
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text("text", encoding="utf-8")
+    seen = []
+    db = AsyncMock()
+    db.scalar.return_value = str(content_path)
+    db.commit.side_effect = lambda: seen.append(content_path.exists())
+    
+    assert asyncio.run(documents.delete_document(1, db=db)) == {"message": "Document deleted successfully"}
+    assert seen == [True]
+    assert not content_path.exists()
+
+def test_delete_document_keeps_the_file_when_commit_fails(tmp_path):
+    """Test that a failed commit leaves the file in place for the surviving row"""
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text("text", encoding="utf-8")
+    db = AsyncMock()
+    db.scalar.return_value = str(content_path)
+    db.commit.side_effect = RuntimeError("database is locked")
+    
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(documents.delete_document(1, db=db))
+    
+    assert exc_info.value.status_code == 500
+    assert content_path.exists()
+
+def test_wildcard_if_none_match_does_not_hide_a_missing_document():
+    """Test that If-None-Match: * still gets a 404 for a document that does not exist"""
+    from unittest.mock import MagicMock, patch
+    from starlette.responses import Response
+    
+    request = MagicMock(headers={"if-none-match": "*"})
+    with patch.object(documents, "DocumentService") as mock_cls:
+        mock_cls.return_value.get_version = AsyncMock(return_value=None)
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(documents.get_document(999, request, Response(), db=AsyncMock()))
+    
+    assert exc_info.value.status_code == 404
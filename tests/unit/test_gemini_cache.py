@@ -0,0 +1,37 @@
+from unittest.mock import patch
+from backend.app.services import theme_identification
+from backend.app.services.gemini_cache import GeminiResponseCache
+
+def test_cache_round_trip_survives_restart(tmp_path):
+    """Test that cached responses are served from memory and from disk"""
+    path = str(tmp_path / "gemini.db")
+    key = GeminiResponseCache.make_key("gemini-test", "prompt")
+    themes = [{"theme_name": "Theme", "evidence": "quote"}]
+    
+    cache = GeminiResponseCache(path)
+    assert cache.get(key) is None
+    cache.put(key, themes)
+    assert cache.get(key) == themes
+    
+    restarted = GeminiResponseCache(path)
+    assert restarted.get(key) == themes
+    assert restarted.get(GeminiResponseCache.make_key("other-model", "prompt")) is None
+
+def test_cache_expires_entries(tmp_path):
+    """Test that entries older than the TTL are ignored"""
+    cache = GeminiResponseCache(str(tmp_path / "gemini.db"), ttl=0)
+    cache.put("key", [1])
+    
+    assert cache.get("key") is None
+
+def test_call_gemini_api_reuses_cached_themes(tmp_path):
+    """Test that the same prompt only reaches Gemini once"""
+    cache = GeminiResponseCache(str(tmp_path / "gemini.db"))
+    themes = [{"theme_name": "Theme"}]
+    
+    with patch.object(theme_identification, 'gemini_cache', cache), \
+         patch.object(theme_identification, 'request_themes', return_value=themes) as mock_request:
+        assert theme_identification.call_gemini_api("prompt") == themes
+        assert theme_identification.call_gemini_api("prompt") == themes
+    
+    mock_request.assert_called_once_with("prompt")
@@ -0,0 +1,122 @@
+from unittest.mock import patch
+from backend.app.services.vectorstore import gemini_embeddings
+import pytest
+from backend.app.services.vectorstore.embedding_cache import EmbeddingCache
+from backend.app.services.vectorstore.gemini_embeddings import GeminiEmbeddings
+
+@pytest.fixture(autouse=True)
+def disable_embedding_cache():
+    with patch.object(gemini_embeddings, 'embedding_cache', EmbeddingCache("")):
+        yield
+
+def test_embed_query_is_cached_per_model_and_text():
+    """Test that repeated queries reuse the cached embedding"""
+    gemini_embeddings._embed_query.cache_clear()
+    with patch.object(gemini_embeddings.genai, 'embed_content', return_value={"embedding": [0.1, 0.2]}) as mock_embed:
+        embeddings = GeminiEmbeddings(normalize=False)
+        
+        assert embeddings.embed_query("what is the theme?") == [0.1, 0.2]
+        assert embeddings.embed_query("what is the theme?") == [0.1, 0.2]
+        assert mock_embed.call_count == 1
+        
+        GeminiEmbeddings(model_name="models/other-embedding", normalize=False).embed_query("what is the theme?")
+        assert mock_embed.call_count == 2
+    
+    gemini_embeddings._embed_query.cache_clear()
+
+def test_embed_documents_batches_requests():
+    """Test that documents are embedded in ordered batches of at most batch_size"""
+    def fake_embed(model, content, task_type):
+        return {"embedding": [[float(len(text))] for text in content]}
+    
+    texts = ["a" * n for n in range(1, 6)]
+    with patch.object(gemini_embeddings.genai, 'embed_content', side_effect=fake_embed) as mock_embed:
+        result = GeminiEmbeddings(normalize=False, batch_size=2).embed_documents(texts)
+    
+    assert result == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert mock_embed.call_count == 3
+
+def test_embed_documents_falls_back_to_single_requests():
+    """Test that a failed batch is retried one text at a time"""
+    def fake_embed(model, content, task_type):
+        if isinstance(content, list):
+            raise RuntimeError("batch rejected")
+        return {"embedding": [float(len(content))]}
+    
+    with patch.object(gemini_embeddings.genai, 'embed_content', side_effect=fake_embed):
+        result = GeminiEmbeddings(normalize=False).embed_documents(["ab", "abc"])
+    
+    assert result == [[2.0], [3.0]]
+    assert GeminiEmbeddings(normalize=False, batch_size=500).batch_size == 100
+
+def test_embed_batch_retries_rate_limits():
+    """Test that a rate-limited batch is retried before falling back"""
+    from google.api_core.exceptions import ResourceExhausted
+    
+    responses = [ResourceExhausted("slow down"), {"embedding": [[1.0], [2.0]]}]
+    with patch.object(gemini_embeddings.genai, 'embed_content', side_effect=responses) as mock_embed, \
+         patch.object(gemini_embeddings.time, 'sleep') as mock_sleep:
+        result = GeminiEmbeddings(normalize=False).embed_documents(["a", "b"])
+    
+    assert result == [[1.0], [2.0]]
+    assert mock_embed.call_count == 2
+    mock_sleep.assert_called_once()
+
+def test_embed_documents_deduplicates_texts():
+    """Test that duplicate texts are embedded once and returned in every position"""
+    def fake_embed(model, content, task_type):
+        return {"embedding": [[float(len(text))] for text in content]}
+    
+    with patch.object(gemini_embeddings.genai, 'embed_content', side_effect=fake_embed) as mock_embed:
+        result = GeminiEmbeddings(normalize=False).embed_documents(["ab", "abc", "ab"])
+    
+    assert result == [[2.0], [3.0], [2.0]]
+    assert mock_embed.call_args.kwargs["content"] == ["ab", "abc"]
+
+def test_embed_documents_reuses_persisted_embeddings(tmp_path):
+    """Test that only texts missing from the on-disk cache are embedded"""
+    def fake_embed(model, content, task_type):
+        return {"embedding": [[float(len(text))] for text in content]}
+    
+    path = str(tmp_path / "embeddings.db")
+    with patch.object(gemini_embeddings.genai, 'embed_content', side_effect=fake_embed) as mock_embed:
+        assert GeminiEmbeddings(normalize=False, cache=EmbeddingCache(path)).embed_documents(["ab", "abc"]) == [[2.0], [3.0]]
+        result = GeminiEmbeddings(normalize=False, cache=EmbeddingCache(path)).embed_documents(["abc", "abcd", "ab"])
+    
+    assert result == [[3.0], [4.0], [2.0]]
+    assert mock_embed.call_count == 2
+    assert mock_embed.call_args.kwargs["content"] == ["abcd"]
+
+def test_partition_texts_respects_item_and_byte_limits():
+    """Test that batches close on either the item count or the byte budget"""
+    from backend.app.services.vectorstore.gemini_embeddings import partition_texts
+    
+    assert partition_texts(["a"] * 5, 2, 100) == [["a", "a"], ["a", "a"], ["a"]]
+    assert partition_texts(["ééé", "ab", "abcd", "x"], 10, 6) == [["ééé"], ["ab", "abcd"], ["x"]]
+    assert partition_texts([], 10, 10) == []
+
+def test_embed_batch_splits_rejected_batches():
+    """Test that a rejected batch is halved and retried"""
+    from google.api_core.exceptions import InvalidArgument
+    
+    def fake_embed(model, content, task_type):
+        if len(content) > 2:
+            raise InvalidArgument("payload too large")
+        return {"embedding": [[float(len(text))] for text in content]}
+    
+    with patch.object(gemini_embeddings.genai, 'embed_content', side_effect=fake_embed):
+        result = GeminiEmbeddings(normalize=False).embed_documents(["a", "bb", "ccc", "dddd"])
+    
+    assert result == [[1.0], [2.0], [3.0], [4.0]]
+
+def test_embeddings_are_unit_length_by_default():
+    """Test that document and query embeddings are L2-normalized"""
+    gemini_embeddings._embed_query.cache_clear()
+    with patch.object(gemini_embeddings.genai, 'embed_content', side_effect=[{"embedding": [[3.0, 4.0], [0.0, 2.0]]}, {"embedding": [6.0, 8.0]}]):
+        embeddings = GeminiEmbeddings()
+        documents = embeddings.embed_documents(["a", "b"])
+        query = embeddings.embed_query("q")
+    
+    assert documents == [pytest.approx([0.6, 0.8]), pytest.approx([0.0, 1.0])]
+    assert query == pytest.approx([0.6, 0.8])
+    gemini_embeddings._embed_query.cache_clear()
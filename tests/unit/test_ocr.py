@@ -1,22 +1,7 @@
 import pytest
 from unittest.mock import patch, MagicMock
-import tempfile
-import os
 from backend.app.services.ocr import extract_text_from_pdf
 
-@pytest.fixture
-def sample_pdf_file():
-    """Create a temporary PDF file for testing"""
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
-        temp_file.write(b"%PDF-1.5\nSample PDF content")
-        temp_file_path = temp_file.name
-    
-    yield temp_file_path
-    
-    # Clean up
-    if os.path.exists(temp_file_path):
-        os.unlink(temp_file_path)
-
 @pytest.fixture
 def mock_fitz_document():
     """Mock a PyMuPDF Document object"""
@@ -79,4 +64,38 @@ def test_extract_text_handles_exceptions(mock_fitz_open, sample_pdf_file):
         extract_text_from_pdf(sample_pdf_file)
     
     # Check that our error message is in the exception
-    assert "PDF extraction error" in str(excinfo.value) 
\ No newline at end of file
+    assert "PDF extraction error" in str(excinfo.value) 
+
+def test_extract_text_from_large_pdf_uses_page_pool():
+    """Test that large PDFs extracted in the worker pool match in-process extraction"""
+    import fitz
+    from backend.app.services import ocr
+    
+    doc = fitz.open()
+    for i in range(ocr.PARALLEL_PAGE_THRESHOLD + 4):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Text from page {i + 1}")
+    pdf_bytes = doc.tobytes()
+    
+    parallel_text = extract_text_from_pdf(pdf_bytes)
+    
+    with patch.object(ocr, 'PARALLEL_PAGE_THRESHOLD', 10_000):
+        sequential_text = extract_text_from_pdf(pdf_bytes)
+    
+    assert parallel_text == sequential_text
+    assert parallel_text.index("--- Page 2 ---") < parallel_text.index("--- Page 20 ---")
+
+
+@patch('backend.app.services.ocr.pytesseract.image_to_string')
+@patch('backend.app.services.ocr.Image.open')
+def test_extract_text_from_images_keeps_order(mock_image_open, mock_image_to_string):
+    """Test batch OCR returns one result per image, in input order"""
+    from backend.app.services.ocr import extract_text_from_images
+    
+    mock_image_open.side_effect = lambda buffer: buffer.getvalue().decode()
+    mock_image_to_string.side_effect = lambda image, **kwargs: f"text of {image}"
+    
+    texts = extract_text_from_images([b"a", b"b", b"c"])
+    
+    assert texts == ["text of a", "text of b", "text of c"]
+    assert mock_image_to_string.call_args.kwargs["config"] == "--oem 1 --psm 6"
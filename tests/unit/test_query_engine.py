@@ -0,0 +1,247 @@
+import pytest
+import numpy as np
+from backend.app.services.vectorstore.query_engine import SemanticQueryCache, normalize_embedding
+
+def test_semantic_query_cache_exact_and_similar_hits():
+    """Test exact-text hits, near-duplicate embedding hits and misses"""
+    cache = SemanticQueryCache(capacity=2, threshold=0.97)
+    results = [{"matched_text": "climate policy", "filename": "a.pdf"}]
+    
+    key = cache.make_key("climate policy", 5)
+    cache.put(key, normalize_embedding([1.0, 0.0, 0.0]), 5, results)
+    
+    assert cache.get(key) is results
+    assert cache.get_similar(normalize_embedding([0.99, 0.05, 0.0]), 5) is results
+    assert cache.get_similar(normalize_embedding([0.99, 0.05, 0.0]), 3) is None
+    assert cache.get_similar(normalize_embedding([0.0, 1.0, 0.0]), 5) is None
+    assert cache.stats() == {"size": 1, "hits": 1, "semantic_hits": 1, "misses": 2, "evictions": 0}
+    assert cache.make_key("  climate\tpolicy ", 5) == key
+
+def test_semantic_query_cache_evicts_least_recently_used():
+    """Test that the cache stays within capacity"""
+    cache = SemanticQueryCache(capacity=2)
+    for i, vector in enumerate(np.eye(3)):
+        cache.put(cache.make_key(f"query {i}", 5), vector, 5, [{"index": i}])
+    
+    assert cache.get(cache.make_key("query 0", 5)) is None
+    assert cache.get(cache.make_key("query 2", 5)) == [{"index": 2}]
+    assert cache.get_similar(np.eye(3)[1], 5) == [{"index": 1}]
+    assert cache.stats()["evictions"] == 1
+
+def test_vectordb_is_shared_until_invalidated():
+    """Test that the Chroma client is created once and rebuilt after invalidation"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_engine
+    
+    query_engine.invalidate_vectordb()
+    with patch.object(query_engine, "Chroma") as mock_chroma:
+        first, _ = query_engine.get_vectordb()
+        second, _ = query_engine.get_vectordb()
+        assert first is second
+        assert mock_chroma.call_count == 1
+        
+        query_engine.query_cache.put("key", normalize_embedding([1.0]), 5, [])
+        query_engine.invalidate_vectordb()
+        query_engine.get_vectordb()
+        assert mock_chroma.call_count == 2
+        assert query_engine.query_cache.stats()["size"] == 0
+    
+    query_engine.invalidate_vectordb()
+
+def test_vectordb_reloads_after_rebuild_on_disk(tmp_path):
+    """Test that a store rebuilt by another process is picked up on the next query"""
+    import os
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_engine
+    
+    query_engine.invalidate_vectordb()
+    with patch.object(query_engine, "CHROMA_DB_PATH", str(tmp_path)), \
+         patch.object(query_engine, "Chroma") as mock_chroma:
+        query_engine.mark_store_built()
+        query_engine.get_vectordb()
+        query_engine.get_vectordb()
+        assert mock_chroma.call_count == 1
+        
+        query_engine.query_cache.put("key", normalize_embedding([1.0]), 5, [])
+        marker = os.path.join(str(tmp_path), query_engine.STORE_MARKER)
+        stat = os.stat(marker)
+        os.utime(marker, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        query_engine.get_vectordb()
+        assert mock_chroma.call_count == 2
+        assert query_engine.query_cache.stats()["size"] == 0
+    
+    query_engine.invalidate_vectordb()
+
+def test_query_documents_embeds_once_and_searches_by_vector(tmp_path):
+    """Test that the query is embedded once, searched by vector and then served from cache"""
+    from unittest.mock import MagicMock, patch
+    from backend.app.services.vectorstore import query_engine
+    
+    vectordb = MagicMock()
+    vectordb._collection.query.return_value = {
+        "documents": [["Climate text"]],
+        "metadatas": [[{"filename": "a.txt", "page": 2, "paragraph": 6}]],
+        "distances": [[0.18]],
+    }
+    embeddings = MagicMock()
+    embeddings.embed_query.return_value = [0.6, 0.8]
+    
+    query_engine.invalidate_vectordb()
+    with patch.object(query_engine, "CHROMA_DB_PATH", str(tmp_path)), \
+         patch.object(query_engine, "get_vectordb", return_value=(vectordb, embeddings)):
+        first = query_engine.query_documents("climate", top_k=3)
+        second = query_engine.query_documents("climate", top_k=3)
+    
+    assert first == second
+    assert first[0]["citation"] == "a.txt, Page 2, Para 7"
+    assert first[0]["relevance"] == pytest.approx(0.82)
+    embeddings.embed_query.assert_called_once_with("climate")
+    vectordb._collection.query.assert_called_once_with(
+        query_embeddings=[[0.6, 0.8]], n_results=3, include=["documents", "metadatas", "distances"]
+    )
+    vectordb.similarity_search.assert_not_called()
+    query_engine.invalidate_vectordb()
+
+def test_closer_hits_get_higher_relevance_and_rank_first():
+    """Test that Chroma distances become similarities, so the nearest chunk ranks first"""
+    from backend.app.services.vectorstore.query_engine import format_results
+    from backend.app.services.vectorstore.query_processor import top_matches
+    
+    results = format_results(
+        ["Far text", "Near text"],
+        [{"filename": "a.txt"}, {"filename": "b.txt"}],
+        [0.7, 0.05]
+    )
+    
+    assert [result["relevance"] for result in results] == pytest.approx([0.3, 0.95])
+    assert [match["matched_text"] for match in top_matches(results, limit=1)] == ["Near text"]
+
+def test_query_documents_async_matches_sync_results(tmp_path):
+    """Test that the async query path formats results like the sync one"""
+    import asyncio
+    from unittest.mock import MagicMock, patch
+    from backend.app.services.vectorstore import query_engine
+    
+    vectordb = MagicMock()
+    vectordb._collection.query.return_value = {
+        "documents": [["Trade text"]],
+        "metadatas": [[{"filename": "b.txt", "paragraph": 3}]],
+        "distances": [[0.25]],
+    }
+    embeddings = MagicMock()
+    embeddings.embed_query.return_value = [1.0, 0.0]
+    
+    query_engine.invalidate_vectordb()
+    with patch.object(query_engine, "CHROMA_DB_PATH", str(tmp_path)), \
+         patch.object(query_engine, "get_vectordb", return_value=(vectordb, embeddings)):
+        results = asyncio.run(query_engine.query_documents_async("trade", top_k=2))
+        assert query_engine.query_documents("trade", top_k=2) == results
+    
+    assert results == [{"matched_text": "Trade text", "filename": "b.txt", "citation": "b.txt, Para 4", "page": None, "paragraph": 3, "relevance": 0.75}]
+    assert vectordb._collection.query.call_count == 1
+    query_engine.invalidate_vectordb()
+
+def test_query_documents_batch_embeds_misses_together(tmp_path):
+    """Test that uncached queries are embedded and searched in one batch"""
+    from unittest.mock import MagicMock, patch
+    from backend.app.services.vectorstore import query_engine
+    
+    vectordb = MagicMock()
+    vectordb._collection.query.return_value = {
+        "documents": [["Climate text"], ["Energy text"]],
+        "metadatas": [[{"filename": "a.txt", "page": 1, "paragraph": 1}], [{"filename": "b.txt"}]],
+        "distances": [[0.1], [0.3]],
+    }
+    embeddings = MagicMock()
+    embeddings.embed_queries.return_value = [[1.0, 0.0], [0.0, 1.0]]
+    
+    query_engine.invalidate_vectordb()
+    with patch.object(query_engine, "CHROMA_DB_PATH", str(tmp_path)), \
+         patch.object(query_engine, "get_vectordb", return_value=(vectordb, embeddings)):
+        cached = query_engine.query_documents_batch(["climate"], top_k=3)
+        vectordb._collection.query.return_value = {
+            "documents": [["Energy text"]],
+            "metadatas": [[{"filename": "b.txt"}]],
+            "distances": [[0.3]],
+        }
+        embeddings.embed_queries.return_value = [[0.0, 1.0]]
+        results = query_engine.query_documents_batch(["climate", "energy"], top_k=3)
+    
+    assert results[0] == cached[0]
+    assert results[0][0]["citation"] == "a.txt, Page 1, Para 2"
+    assert results[1][0]["filename"] == "b.txt"
+    assert results[0][0]["relevance"] == pytest.approx(0.9)
+    assert results[1][0]["relevance"] == pytest.approx(0.7)
+    embeddings.embed_queries.assert_called_with(["energy"])
+    assert vectordb._collection.query.call_count == 2
+    query_engine.invalidate_vectordb()
+
+def test_index_ready_stops_checking_once_the_store_exists(tmp_path):
+    """Test that the store path is only stat-ed until it is first found"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_engine
+    
+    query_engine.invalidate_vectordb()
+    with patch.object(query_engine, "CHROMA_DB_PATH", str(tmp_path / "store")):
+        assert not query_engine.index_ready()
+        (tmp_path / "store").mkdir()
+        with patch.object(query_engine.os.path, "exists", wraps=query_engine.os.path.exists) as exists:
+            assert query_engine.index_ready()
+            assert query_engine.index_ready()
+            assert exists.call_count == 1
+        
+        query_engine.invalidate_vectordb()
+        (tmp_path / "store").rmdir()
+        assert not query_engine.index_ready()
+
+def test_search_vectors_mmr_reports_similarity():
+    """Test that MMR results carry similarities derived from the candidate distances"""
+    from unittest.mock import MagicMock
+    from backend.app.services.vectorstore.query_engine import search_vectors_mmr
+    
+    vectordb = MagicMock()
+    vectordb._collection.query.return_value = {
+        "documents": [["Near text", "Far text"]],
+        "metadatas": [[{"filename": "a.txt"}, {"filename": "b.txt"}]],
+        "distances": [[0.1, 0.6]],
+        "embeddings": [[normalize_embedding([1.0, 0.0]), normalize_embedding([0.6, 0.8])]],
+    }
+    
+    results = search_vectors_mmr(vectordb, [1.0, 0.0], 2, lambda_mult=0.5)
+    
+    assert [result["matched_text"] for result in results] == ["Near text", "Far text"]
+    assert [result["relevance"] for result in results] == pytest.approx([0.9, 0.4])
+
+def test_mmr_select_skips_near_duplicates():
+    """Test that MMR prefers a diverse candidate over a near-duplicate of the best hit"""
+    from backend.app.services.vectorstore.query_engine import mmr_select
+    
+    candidates = np.stack([
+        normalize_embedding([1.0, 0.1, 0.0]),
+        normalize_embedding([1.0, 0.12, 0.0]),
+        normalize_embedding([0.7, 0.0, 0.7]),
+    ])
+    query = normalize_embedding([1.0, 0.0, 0.2])
+    
+    assert mmr_select(query, candidates, 2, lambda_mult=0.5) == [0, 2]
+    assert mmr_select(query, candidates, 2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(query, candidates[:0], 2, lambda_mult=0.5) == []
+
+def test_query_documents_logs_failures_with_traceback(tmp_path, caplog):
+    """Test that a failed search logs the traceback and returns the fixed error payload"""
+    import logging
+    from unittest.mock import MagicMock, patch
+    from backend.app.services.vectorstore import query_engine
+    
+    embeddings = MagicMock()
+    embeddings.embed_query.side_effect = TimeoutError("embedding timed out")
+    
+    query_engine.invalidate_vectordb()
+    with patch.object(query_engine, "CHROMA_DB_PATH", str(tmp_path)), \
+         patch.object(query_engine, "get_vectordb", return_value=(MagicMock(), embeddings)), \
+         caplog.at_level(logging.ERROR, logger=query_engine.logger.name):
+        results = query_engine.query_documents("climate")
+    
+    assert results == query_engine.QUERY_ERROR_RESULTS
+    assert caplog.records[-1].exc_info[0] is TimeoutError
+    query_engine.invalidate_vectordb()
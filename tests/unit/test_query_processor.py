@@ -0,0 +1,526 @@
+from types import SimpleNamespace
+from backend.app.services.vectorstore.query_processor import basic_document_search
+
+def test_basic_document_search_scores_paragraphs(tmp_path):
+    """Test that paragraphs need two query term hits and are ranked by relevance"""
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text(
+        "Climate policy shapes trade.\n\nOnly climate here.\n\nClimate policy and trade policy reform.",
+        encoding="utf-8"
+    )
+    doc = SimpleNamespace(id=1, filename="doc.txt", content_path=str(content_path))
+    
+    matches = basic_document_search("climate policy reform", [doc], citation_level="paragraph")
+    
+    assert [match["paragraph"] for match in matches] == [2, 0]
+    assert matches[0]["relevance"] == 0.1 * 3
+    assert matches[1]["citation"] == "doc.txt, Para 1"
+
+def test_basic_document_search_skips_unreadable_documents(tmp_path):
+    """Test that a missing file does not stop the other documents from being scored"""
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text("Climate policy reform.", encoding="utf-8")
+    docs = [
+        SimpleNamespace(id=1, filename="missing.txt", content_path=str(tmp_path / "missing.txt")),
+        SimpleNamespace(id=2, filename="doc.txt", content_path=str(content_path))
+    ]
+    
+    matches = basic_document_search("climate policy", docs, citation_level="document")
+    
+    assert [match["id"] for match in matches] == [2]
+
+def test_basic_document_search_scores_in_worker_processes(tmp_path, monkeypatch):
+    """Test that the process pool path returns the same matches as the in-process path"""
+    from backend.app.services.vectorstore import query_processor
+    docs = []
+    for doc_id, text in enumerate(["Climate policy shapes trade.", "Climate policy reform.\n\nClimate only."], start=1):
+        content_path = tmp_path / f"doc{doc_id}.txt"
+        content_path.write_text(text, encoding="utf-8")
+        docs.append(SimpleNamespace(id=doc_id, filename=content_path.name, content_path=str(content_path)))
+    
+    expected = basic_document_search("climate policy reform", docs, citation_level="paragraph")
+    monkeypatch.setattr(query_processor, "PARALLEL_SEARCH_THRESHOLD", 2)
+    monkeypatch.setattr(query_processor, "SCORE_WORKERS", 2)
+    
+    assert basic_document_search("climate policy reform", docs, citation_level="paragraph") == expected
+    pool = query_processor._get_score_pool()
+    assert basic_document_search("climate policy reform", docs, citation_level="paragraph") == expected
+    assert query_processor._get_score_pool() is pool
+    assert [match["id"] for match in expected] == [2, 1]
+
+def test_search_with_gemini_searches_chunks_concurrently(tmp_path):
+    """Test that every chunk of documents is searched and matches are merged by relevance"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    docs = []
+    for i in range(7):
+        content_path = tmp_path / f"doc{i}.txt"
+        content_path.write_text(f"Document {i}", encoding="utf-8")
+        docs.append(SimpleNamespace(id=i, filename=f"doc{i}.txt", content_path=str(content_path), filetype="txt"))
+    
+    def fake_call(system_prompt, user_prompt):
+        first_id = int(user_prompt.split("DOCUMENT ID: ")[1].split(",")[0])
+        return [{"id": first_id, "relevance": 0.9 if first_id else 0.8}]
+    
+    with patch.object(query_processor, "call_gemini_api", side_effect=fake_call) as mock_call, \
+         patch.object(query_processor.time, "sleep"):
+        matches = query_processor.search_with_gemini("query", docs, 0.7, False, citation_level="document")
+    
+    assert mock_call.call_count == 2
+    assert [match["id"] for match in matches] == [5, 0]
+
+def test_search_with_gemini_reads_only_the_prompt_prefix(tmp_path):
+    """Test that long documents are cut at the prompt limit and marked as truncated"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    content_path = tmp_path / "long.txt"
+    content_path.write_text("a" * 8000 + "TAIL", encoding="utf-8")
+    doc = SimpleNamespace(id=1, filename="long.txt", content_path=str(content_path), filetype="txt")
+    
+    with patch.object(query_processor, "call_gemini_api", return_value=[]) as mock_call:
+        query_processor.search_with_gemini("query", [doc], 0.7, False, citation_level="document")
+    
+    prompt = mock_call.call_args.args[1]
+    assert "a" * 8000 + "... [content truncated]" in prompt
+    assert "TAIL" not in prompt
+
+def test_search_vector_store_maps_chunks_to_documents():
+    """Test that vector hits are attributed to their documents and unknown files are dropped"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    doc = SimpleNamespace(id=3, filename="report.pdf", content_path="data/report.pdf.txt")
+    hits = [
+        {"matched_text": "Trade text", "filename": "report.pdf.txt", "citation": "report.pdf.txt, Para 4", "page": None, "paragraph": 4, "relevance": 0.6},
+        {"matched_text": "Stale text", "filename": "deleted.pdf.txt", "citation": "deleted.pdf.txt", "page": None, "paragraph": 1, "relevance": 0.9},
+        {"matched_text": "Climate text", "filename": "report.pdf.txt", "citation": "report.pdf.txt, Page 2, Para 7", "page": 2, "paragraph": 7, "relevance": 0.8},
+    ]
+    
+    with patch.object(query_processor, "index_ready", return_value=True), \
+         patch.object(query_processor, "query_documents", return_value=hits):
+        matches = query_processor.search_vector_store("climate", [doc], 0.7, advanced_mode=False)
+        
+        with patch.object(query_processor, "call_gemini_api", return_value=[{"passage": 0, "relevance": 0.95}, {"passage": 1, "relevance": 0.2}]):
+            reranked = query_processor.search_vector_store("climate", [doc], 0.7, advanced_mode=True)
+    
+    assert [match["matched_text"] for match in matches] == ["Climate text"]
+    assert matches[0]["id"] == 3
+    assert matches[0]["citation"] == "report.pdf, Page 2, Para 7"
+    assert [(match["matched_text"], match["relevance"]) for match in reranked] == [("Trade text", 0.95)]
+
+def test_search_vector_store_applies_the_citation_level(tmp_path):
+    """Test that vector hits are cited at document level or narrowed to a sentence"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    content_path = tmp_path / "report.pdf.txt"
+    content_path.write_text("Intro text.\n\nTrade follows. Climate policy matters here.", encoding="utf-8")
+    doc = SimpleNamespace(id=3, filename="report.pdf", content_path=str(content_path))
+    hit = {"matched_text": "Climate policy matters here.", "filename": "report.pdf.txt", "citation": "report.pdf.txt, Para 2", "page": None, "paragraph": 1, "relevance": 0.8}
+    
+    with patch.object(query_processor, "index_ready", return_value=True), \
+         patch.object(query_processor, "query_documents", side_effect=lambda *args, **kwargs: [dict(hit)]):
+        [document_match] = query_processor.search_vector_store("climate", [doc], 0.7, False, "document")
+        [sentence_match] = query_processor.search_vector_store("climate", [doc], 0.7, False, "sentence")
+        assert query_processor.search_vector_store("climate", [doc], 0.9, False, "paragraph") is None
+    
+    assert document_match["citation"] == "report.pdf"
+    assert sentence_match["citation"] == "report.pdf, Para 2, Sentence 2"
+    assert sentence_match["sentence"] == 1
+
+def test_rerank_chunks_skips_non_numeric_ratings():
+    """Test that string or null ratings from the model are ignored rather than compared"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    matches = [{"matched_text": "A", "relevance": 0.5}, {"matched_text": "B", "relevance": 0.4}, {"matched_text": "C", "relevance": 0.3}]
+    ratings = [{"passage": 0, "relevance": "0.9"}, {"passage": 1, "relevance": None}, {"passage": 2, "relevance": 0.8}, "passage 1"]
+    
+    with patch.object(query_processor, "call_gemini_api", return_value=ratings):
+        reranked = query_processor.rerank_chunks("query", matches, 0.7)
+    
+    assert reranked == [{"matched_text": "C", "relevance": 0.8}]
+
+def test_search_vector_store_falls_back_without_index():
+    """Test that a missing vector store defers to full-document search"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    doc = SimpleNamespace(id=3, filename="report.pdf", content_path="data/report.pdf.txt")
+    with patch.object(query_processor, "index_ready", return_value=False):
+        assert query_processor.search_vector_store("climate", [doc], 0.7, advanced_mode=False) is None
+
+def test_load_prompt_document_tolerates_invalid_utf8(tmp_path):
+    """Test that a stray invalid byte does not drop the document from the prompt"""
+    from backend.app.services.vectorstore.query_processor import load_prompt_document
+    
+    content_path = tmp_path / "doc.txt"
+    content_path.write_bytes("Résumé ".encode("utf-8") + b"\xff" + b" tail")
+    doc = SimpleNamespace(id=1, filename="doc.txt", content_path=str(content_path), filetype="txt")
+    
+    loaded = load_prompt_document(doc, "document")
+    
+    assert loaded["content"] == "Résumé � tail"
+    assert loaded["truncated"] is False
+
+def test_parse_citation_reads_paragraph_and_page_in_one_pass():
+    """Test that the first paragraph and page references are extracted"""
+    from backend.app.services.vectorstore.query_processor import parse_citation
+    
+    assert parse_citation("report.pdf, Page 4, Paragraph 12, para 3") == (12, 4)
+    assert parse_citation("report.pdf, Para 2") == (2, None)
+    assert parse_citation("report.pdf") == (None, None)
+
+def test_cached_search_with_gemini_reuses_similar_queries():
+    """Test that near-identical queries over the same documents share one Gemini search"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    from backend.app.services.vectorstore.query_engine import SemanticQueryCache
+    
+    docs = [SimpleNamespace(id=2), SimpleNamespace(id=1)]
+    embeddings = {"climate policy": [1.0, 0.0], "climate policies": [0.99, 0.05], "trade": [0.0, 1.0]}
+    
+    with patch.object(query_processor, "response_cache", SemanticQueryCache(threshold=0.95)), \
+         patch.object(query_processor.query_embeddings, "embed_query", side_effect=embeddings.get), \
+         patch.object(query_processor, "search_with_gemini", return_value=[{"id": 1}]) as mock_search:
+        first = query_processor.cached_search_with_gemini("climate policy", docs, 0.7, False)
+        assert query_processor.cached_search_with_gemini("climate policies", docs[::-1], 0.7, False) is first
+        assert mock_search.call_count == 1
+        
+        query_processor.cached_search_with_gemini("trade", docs, 0.7, False)
+        query_processor.cached_search_with_gemini("climate policy", docs[:1], 0.7, False)
+        query_processor.cached_search_with_gemini("climate policy", docs, 0.7, True)
+        assert mock_search.call_count == 4
+
+def test_cached_search_with_gemini_does_not_cache_empty_results():
+    """Test that an empty search, which may be a failed Gemini call, is retried next time"""
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    from backend.app.services.vectorstore.query_engine import SemanticQueryCache
+    
+    docs = [SimpleNamespace(id=1)]
+    with patch.object(query_processor, "response_cache", SemanticQueryCache(threshold=0.95)), \
+         patch.object(query_processor.query_embeddings, "embed_query", return_value=[1.0, 0.0]), \
+         patch.object(query_processor, "search_with_gemini", side_effect=[[], [{"id": 1}]]) as mock_search:
+        assert query_processor.cached_search_with_gemini("climate policy", docs, 0.7, False) == []
+        assert query_processor.cached_search_with_gemini("climate policy", docs, 0.7, False) == [{"id": 1}]
+    
+    assert mock_search.call_count == 2
+
+def test_call_gemini_api_round_trips_json_with_orjson():
+    """Test that the request body is pre-serialized and fenced JSON replies are parsed"""
+    import orjson
+    from unittest.mock import MagicMock, patch
+    from backend.app.services.vectorstore import query_processor
+    
+    reply = '```json\n[{"filename": "a.txt", "matched_text": "x", "citation": "Para 3", "relevance": 0.9}]\n```'
+    response = MagicMock(content=orjson.dumps({"candidates": [{"content": {"parts": [{"text": reply}]}}]}))
+    
+    with patch.object(query_processor._SESSION, "post", return_value=response) as mock_post:
+        matches = query_processor.call_gemini_api("system", "user")
+    
+    body = orjson.loads(mock_post.call_args.kwargs["data"])
+    assert body["contents"][0]["parts"][0]["text"] == "system\n\nuser"
+    assert matches[0]["paragraph"] == 2
+    assert matches[0]["citation"] == "a.txt, Para 3"
+
+def test_fence_regex_strips_markdown_code_fences():
+    """Test that fenced, bare and language-tagged replies all yield the JSON body"""
+    from backend.app.services.vectorstore.query_processor import _FENCE_RE
+    
+    for reply in ['```json\n[1]\n```', '```\n[1]```\n', '  [1]  ', '```json[1]```']:
+        assert _FENCE_RE.match(reply).group("body") == "[1]"
+
+def test_process_query_runs_search_off_the_event_loop():
+    """Test that documents are loaded asynchronously and searched in a worker thread"""
+    import asyncio
+    import threading
+    from unittest.mock import AsyncMock, MagicMock, patch
+    from backend.app.services.vectorstore import query_processor
+    
+    docs = [SimpleNamespace(id=1)]
+    session = MagicMock()
+    session.execute = AsyncMock(return_value=MagicMock(all=MagicMock(return_value=docs)))
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=session)
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    search_threads = []
+    
+    def fake_search(*args):
+        search_threads.append(threading.current_thread())
+        return [{"id": 1}]
+    
+    with patch.object(query_processor, "AsyncSessionLocal", session_factory), \
+         patch.object(query_processor, "search_documents", side_effect=fake_search) as mock_search:
+        matches = asyncio.run(query_processor.process_query("query", document_ids=[1]))
+    
+    assert matches == [{"id": 1}]
+    assert mock_search.call_args.args[:3] == ("query", docs, [1])
+    assert search_threads[0] is not threading.main_thread()
+
+def test_top_matches_keeps_sorted_order_for_ties():
+    """Test that the top ten match a stable descending sort, ties included"""
+    from backend.app.services.vectorstore.query_processor import top_matches
+    
+    matches = [{"n": i, "relevance": (i * 7) % 5 / 10} for i in range(30)] + [{"n": 30}]
+    expected = sorted(matches, key=lambda x: x.get("relevance", 0), reverse=True)[:10]
+    
+    assert top_matches(matches) == expected
+
+def test_parse_citation_is_memoized():
+    """Test that a repeated citation string is parsed once"""
+    from backend.app.services.vectorstore.query_processor import parse_citation
+    
+    parse_citation.cache_clear()
+    assert parse_citation("report.pdf, Page 4, Para 2") == (2, 4)
+    assert parse_citation("report.pdf, Page 4, Para 2") == (2, 4)
+    assert parse_citation.cache_info().hits == 1
+
+def test_call_gemini_api_caps_concurrent_requests():
+    """Test that no more than the configured number of Gemini calls are in flight"""
+    import threading
+    import time
+    import orjson
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import MagicMock, patch
+    from backend.app.services.vectorstore import query_processor
+    
+    lock = threading.Lock()
+    active = []
+    peak = []
+    
+    def fake_post(*args, **kwargs):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.pop()
+        return MagicMock(content=orjson.dumps({"candidates": [{"content": {"parts": [{"text": "[]"}]}}]}))
+    
+    with patch.object(query_processor, "_GEMINI_SLOTS", threading.BoundedSemaphore(2)), \
+         patch.object(query_processor._SESSION, "post", side_effect=fake_post):
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(lambda _: query_processor.call_gemini_api("system", "user"), range(6)))
+    
+    assert results == [[]] * 6
+    assert max(peak) == 2
+
+def test_sentence_search_reuses_analysis_until_the_file_changes(tmp_path):
+    """Test that sentence-level analysis is cached per file modification time"""
+    import os
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text("Climate policy matters. Nothing here.", encoding="utf-8")
+    doc = SimpleNamespace(id=1, filename="doc.txt", content_path=str(content_path))
+    query_processor.analyze_document_cached.cache_clear()
+    
+    with patch.object(query_processor.TextAnalyzer, "analyze_document", wraps=query_processor.TextAnalyzer.analyze_document) as mock_analyze:
+        first = basic_document_search("climate policy", [doc], citation_level="sentence")
+        assert basic_document_search("climate policy", [doc], citation_level="sentence") == first
+        assert mock_analyze.call_count == 1
+        
+        content_path.write_text("Trade policy matters. Climate policy too.", encoding="utf-8")
+        os.utime(content_path, ns=(0, 10**18))
+        matches = basic_document_search("climate policy", [doc], citation_level="sentence")
+    
+    assert mock_analyze.call_count == 2
+    assert first[0]["matched_text"] == "Climate policy matters."
+    assert matches[0]["matched_text"] == "Climate policy too."
+
+def test_load_prompt_document_rereads_only_changed_files(tmp_path):
+    """Test that prompt text is served from the cache until the file is modified"""
+    import os
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text("First version", encoding="utf-8")
+    doc = SimpleNamespace(id=1, filename="doc.txt", content_path=str(content_path), filetype="txt")
+    query_processor.read_prompt_text.cache_clear()
+    
+    with patch("builtins.open", wraps=open) as mock_open:
+        assert query_processor.load_prompt_document(doc, "document")["content"] == "First version"
+        assert query_processor.load_prompt_document(doc, "document")["content"] == "First version"
+        assert mock_open.call_count == 1
+    
+    content_path.write_text("Second version", encoding="utf-8")
+    os.utime(content_path, ns=(0, 10**18))
+    assert query_processor.load_prompt_document(doc, "document")["content"] == "Second version"
+
+def test_load_prompt_document_analyzes_past_the_prompt_cut(tmp_path):
+    """Test that citation analysis covers the whole file while the prompt text is truncated"""
+    from backend.app.services.vectorstore import query_processor
+    
+    content_path = tmp_path / "long.txt"
+    content_path.write_text("a" * query_processor.PROMPT_CONTENT_CHARS + "\n\nLate paragraph.", encoding="utf-8")
+    doc = SimpleNamespace(id=4, filename="long.txt", content_path=str(content_path), filetype="txt")
+    
+    loaded = query_processor.load_prompt_document(doc, "paragraph")
+    
+    assert loaded["truncated"] is True
+    assert len(loaded["content"]) == query_processor.PROMPT_CONTENT_CHARS
+    assert loaded["analysis"]["paragraphs"][-1]["content"] == "Late paragraph."
+
+def test_enhance_matches_with_citation_info_looks_up_paragraphs_and_sentences():
+    """Test that matches are resolved to paragraph ids and sentences by index and by content"""
+    from backend.app.services.text_analysis import TextAnalyzer
+    from backend.app.services.vectorstore.query_processor import enhance_matches_with_citation_info
+    
+    text = "Intro sentence. Second intro.\n\nClimate policy matters. Trade follows."
+    documents = [{"id": 3, "analysis": TextAnalyzer.analyze_document(3, text)}]
+    matches = [
+        {"id": 3, "filename": "a.txt", "matched_text": "Trade follows.", "paragraph": 1},
+        {"id": 3, "filename": "a.txt", "matched_text": "Second intro."}
+    ]
+    
+    enhanced = enhance_matches_with_citation_info(matches, documents, "sentence")
+    
+    paragraphs = documents[0]["analysis"]["paragraphs"]
+    assert enhanced[0]["paragraph_id"] == paragraphs[1]["id"]
+    assert enhanced[0]["citation"] == "a.txt, Para 2, Sentence 2"
+    assert enhanced[1]["paragraph"] == 0
+    assert enhanced[1]["citation"] == "a.txt, Para 1, Sentence 2"
+
+def test_process_query_reuses_the_callers_session():
+    """Test that a passed-in session is used for the document lookup"""
+    import asyncio
+    from unittest.mock import AsyncMock, MagicMock, patch
+    from backend.app.services.vectorstore import query_processor
+    
+    docs = [SimpleNamespace(id=1)]
+    session = MagicMock()
+    session.execute = AsyncMock(return_value=MagicMock(all=MagicMock(return_value=docs)))
+    
+    with patch.object(query_processor, "AsyncSessionLocal") as session_factory, \
+         patch.object(query_processor, "search_documents", return_value=[{"id": 1}]):
+        matches = asyncio.run(query_processor.process_query("query", db=session))
+    
+    assert matches == [{"id": 1}]
+    session.execute.assert_awaited_once()
+    session_factory.assert_not_called()
+
+def test_term_relevance_stops_once_saturated():
+    """Test that scoring stops scanning terms once relevance reaches the cap"""
+    from backend.app.services.vectorstore.query_processor import term_relevance
+    
+    checked = []
+    
+    class Text(str):
+        def lower(self):
+            return self
+        
+        def __contains__(self, term):
+            checked.append(term)
+            return str.__contains__(self, term)
+    
+    assert term_relevance(Text("climate policy"), (("climate", 10), ("policy", 1))) == 1.0
+    assert checked == ["climate"]
+    assert term_relevance("Climate POLICY", (("climate", 2), ("policy", 1))) == 0.1 * 3
+
+def test_cached_search_with_gemini_coalesces_identical_inflight_queries():
+    """Test that concurrent identical queries share a single Gemini search"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import patch
+    from backend.app.services.vectorstore import query_processor
+    from backend.app.services.vectorstore.query_engine import SemanticQueryCache
+    
+    docs = [SimpleNamespace(id=1)]
+    started = threading.Event()
+    waiting = threading.Event()
+    release = threading.Event()
+    log_info = query_processor.logger.info
+    
+    def watch_log(message, *args):
+        if message.startswith("Waiting for an identical"):
+            waiting.set()
+        log_info(message, *args)
+    
+    def slow_search(*args):
+        started.set()
+        release.wait(5)
+        return [{"id": 1}]
+    
+    with patch.object(query_processor, "response_cache", SemanticQueryCache()), \
+         patch.object(query_processor.query_embeddings, "embed_query", side_effect=RuntimeError("offline")), \
+         patch.object(query_processor.logger, "info", side_effect=watch_log), \
+         patch.object(query_processor, "search_with_gemini", side_effect=slow_search) as mock_search:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(query_processor.cached_search_with_gemini, "climate", docs, 0.7, False)
+            started.wait(5)
+            second = executor.submit(query_processor.cached_search_with_gemini, "climate", docs, 0.7, False)
+            waiting.wait(5)
+            release.set()
+            assert first.result() == second.result() == [{"id": 1}]
+    
+    assert mock_search.call_count == 1
+    assert query_processor._INFLIGHT == {}
+
+def test_enhance_matches_picks_the_most_overlapping_sentence():
+    """Test that inexact quotes resolve to the sentence sharing the most words"""
+    from backend.app.services.text_analysis import TextAnalyzer
+    from backend.app.services.vectorstore.query_processor import enhance_matches_with_citation_info
+    
+    text = "Climate policy matters. Trade follows climate policy closely."
+    documents = [{"id": 4, "analysis": TextAnalyzer.analyze_document(4, text)}]
+    matches = [
+        {"id": 4, "filename": "b.txt", "matched_text": "trade follows policy", "paragraph": 0},
+        {"id": 4, "filename": "b.txt", "matched_text": "policy matters a lot", "paragraph": 0}
+    ]
+    
+    enhanced = enhance_matches_with_citation_info(matches, documents, "sentence")
+    
+    assert [match["sentence"] for match in enhanced] == [1, 0]
+
+def test_document_level_search_matches_on_bytes_for_ascii_terms(tmp_path):
+    """Test that byte-level document scoring matches the decoded path"""
+    from backend.app.services.vectorstore.query_processor import score_document, score_document_bytes
+    
+    content = "Über die CLIMATE Policy — " + "é" * 300
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text(content, encoding="utf-8")
+    term_counts = (("climate", 1), ("policy", 2))
+    
+    expected = score_document(1, "doc.txt", content, term_counts, "document")
+    
+    assert score_document_bytes(1, "doc.txt", str(content_path), term_counts) == expected
+    assert expected[0]["relevance"] == 0.1 * 3
+    assert basic_document_search("über climate", [SimpleNamespace(id=1, filename="doc.txt", content_path=str(content_path))], citation_level="document")[0]["relevance"] == 0.1 * 2
+
+def test_search_prompt_template_is_built_once_per_setting():
+    """Test that the prompt template is reused and only the query is substituted"""
+    from backend.app.services.vectorstore.query_processor import search_prompt_template
+    
+    template = search_prompt_template(0.7, False, "paragraph")
+    
+    assert search_prompt_template(0.7, False, "paragraph") is template
+    prompt = template.substitute(query="cost of $5 {fees}")
+    assert '"cost of $5 {fees}"' in prompt
+    assert "at least 70.0%" in prompt
+    assert "Identify the specific paragraph (by number)" in prompt
+
+def test_search_documents_are_limited_to_ready_uploads(create_tables):
+    """Test that pending and failed uploads are left out of searches"""
+    import asyncio
+    from backend.app.config import AsyncSessionLocal
+    from backend.app.models.document import Document
+    from backend.app.services.vectorstore.query_processor import load_search_documents
+    
+    async def load():
+        async with AsyncSessionLocal() as db:
+            documents = [Document(filename=f"{status}.pdf", content_path=f"{status}.txt", filetype="application/pdf", status=status) for status in ("ready", "pending", "failed")]
+            db.add_all(documents)
+            await db.commit()
+            ids = [document.id for document in documents]
+            rows = await load_search_documents(db, ids)
+            for document in documents:
+                await db.delete(document)
+            await db.commit()
+            return [row.filename for row in rows]
+    
+    assert asyncio.run(load()) == ["ready.pdf"]
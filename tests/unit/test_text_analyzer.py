@@ -1,5 +1,5 @@
 import pytest
-from backend.app.services.text_analysis import TextAnalyzer, generate_text_id
+from backend.app.services.text_analysis import TextAnalyzer, generate_text_id, generate_text_ids
 
 def test_generate_text_id():
     """Test that generate_text_id creates consistent IDs"""
@@ -42,6 +42,15 @@ def test_split_into_paragraphs():
     assert paragraphs[1]["index"] == 1
     assert paragraphs[2]["index"] == 2
 
+def test_iter_paragraphs_is_lazy():
+    """Test that iter_paragraphs yields the same paragraphs as split_into_paragraphs"""
+    test_text = "First.\r\n\r\n\n\nSecond.\n\n  Third.  "
+    
+    paragraphs = TextAnalyzer.iter_paragraphs(test_text)
+    
+    assert next(paragraphs)["content"] == "First."
+    assert list(paragraphs) == TextAnalyzer.split_into_paragraphs(test_text)[1:]
+
 def test_split_paragraph_into_sentences():
     """Test splitting paragraphs into sentences"""
     paragraph = {
@@ -108,4 +117,29 @@ def test_analyze_document():
     
     # Check document IDs are set
     assert result["paragraphs"][0]["document_id"] == document_id
-    assert result["sentences"][0]["document_id"] == document_id 
\ No newline at end of file
+    assert result["sentences"][0]["document_id"] == document_id
+
+def test_generate_text_ids_matches_single():
+    """Test that batched IDs match the per-text IDs"""
+    texts = ["First sentence.", "  Second sentence.  ", "x" * 250]
+    
+    assert generate_text_ids(texts) == [generate_text_id(text) for text in texts]
+    assert generate_text_ids([]) == []
+
+def test_analyze_document_cached_reuses_analysis(tmp_path):
+    """Test that a file is analyzed once per modification time"""
+    import os
+    from backend.app.services.text_analysis import analyze_document_cached
+    
+    text = "Cached paragraph one.\n\nCached paragraph two."
+    content_path = tmp_path / "doc.txt"
+    content_path.write_text(text, encoding="utf-8")
+    mtime_ns = os.stat(content_path).st_mtime_ns
+    first = analyze_document_cached(7, str(content_path), mtime_ns)
+    
+    assert analyze_document_cached(7, str(content_path), mtime_ns) is first
+    assert first == TextAnalyzer.analyze_document(7, text)
+    assert analyze_document_cached(8, str(content_path), mtime_ns)["document_id"] == 8
+    
+    content_path.write_text("Rewritten paragraph.", encoding="utf-8")
+    assert analyze_document_cached(7, str(content_path), mtime_ns + 1)["paragraphs"][0]["content"] == "Rewritten paragraph."
@@ -1,48 +1,67 @@
 import pytest
-from unittest.mock import MagicMock, patch
-import json
+from unittest.mock import DEFAULT, patch
+import orjson
+from types import MappingProxyType, SimpleNamespace
 from backend.app.services.theme_identification import identify_themes
+from backend.app.services.vectorstore.query_engine import SemanticQueryCache, normalize_embedding
 
-@pytest.fixture
+RESPONSE_TEXT = orjson.dumps({
+    "themes": [
+        {
+            "theme_name": "Test Theme 1",
+            "summary": "This is a test theme summary.",
+            "supporting_documents": ["DOC001", "DOC002"],
+            "evidence": "Test evidence for theme 1."
+        }
+    ]
+}).decode()
+
+# Read-only so module-scoped fixtures can hand the same inputs to every test
+SAMPLE_QUERY_RESULTS = (
+    MappingProxyType({
+        "filename": "document1.pdf",
+        "matched_text": "This is test text from document 1 about policy recommendations.",
+        "relevance": 0.85
+    }),
+    MappingProxyType({
+        "filename": "document2.pdf",
+        "matched_text": "More test text about policy implementation strategies.",
+        "relevance": 0.78
+    }),
+)
+
+@pytest.fixture(scope="module")
 def mock_genai_model():
     """Create a mock for the Gemini model"""
-    mock = MagicMock()
-    mock_response = MagicMock()
-    mock_response.text = json.dumps({
-        "themes": [
-            {
-                "theme_name": "Test Theme 1",
-                "summary": "This is a test theme summary.",
-                "supporting_documents": ["DOC001", "DOC002"],
-                "evidence": "Test evidence for theme 1."
-            }
-        ]
-    })
-    mock.generate_content.return_value = mock_response
-    return mock
-
-@pytest.fixture
+    # Only .generate_content(...).text is ever read, so a plain namespace will do
+    response = SimpleNamespace(text=RESPONSE_TEXT)
+    return SimpleNamespace(generate_content=lambda *args, **kwargs: response)
+
+@pytest.fixture(autouse=True)
+def gemini(mock_genai_model):
+    """Patch the Gemini model and API call once per test instead of per decorator"""
+    with patch.multiple(
+        'backend.app.services.theme_identification',
+        model=mock_genai_model,
+        call_gemini_api=DEFAULT,
+        embed_matches=DEFAULT,
+        theme_cache=SemanticQueryCache(threshold=0.92)
+    ) as mocks:
+        mocks["embed_matches"].return_value = None
+        yield SimpleNamespace(
+            model=mock_genai_model,
+            call_gemini=mocks["call_gemini_api"],
+            embed_matches=mocks["embed_matches"]
+        )
+
+@pytest.fixture(scope="module")
 def sample_query_results():
     """Sample query results to use in tests"""
-    return [
-        {
-            "filename": "document1.pdf",
-            "matched_text": "This is test text from document 1 about policy recommendations.",
-            "relevance": 0.85
-        },
-        {
-            "filename": "document2.pdf",
-            "matched_text": "More test text about policy implementation strategies.",
-            "relevance": 0.78
-        }
-    ]
+    return SAMPLE_QUERY_RESULTS
 
-@patch('backend.app.services.theme_identification.genai.GenerativeModel')
-@patch('backend.app.services.theme_identification.call_gemini_api')
-def test_theme_identifier_init(mock_call_gemini, mock_genai_model_cls, mock_genai_model, sample_query_results):
+def test_theme_identifier_init(gemini, sample_query_results):
     """Test initializing the ThemeIdentifier"""
-    mock_genai_model_cls.return_value = mock_genai_model
-    mock_call_gemini.return_value = [
+    gemini.call_gemini.return_value = [
         {
             "theme_name": "Test Theme 1",
             "summary": "This is a test theme summary.",
@@ -58,12 +77,9 @@ def test_theme_identifier_init(mock_call_gemini, mock_genai_model_cls, mock_gena
     assert len(result) == 1
     assert result[0]["theme_name"] == "Test Theme 1"
 
-@patch('backend.app.services.theme_identification.genai.GenerativeModel')
-@patch('backend.app.services.theme_identification.call_gemini_api')
-def test_identify_themes(mock_call_gemini, mock_genai_model_cls, mock_genai_model, sample_query_results):
+def test_identify_themes(gemini, sample_query_results):
     """Test the theme identification process"""
-    mock_genai_model_cls.return_value = mock_genai_model
-    mock_call_gemini.return_value = [
+    gemini.call_gemini.return_value = [
         {
             "theme_name": "Test Theme 1",
             "summary": "This is a test theme summary.",
@@ -76,24 +92,22 @@ def test_identify_themes(mock_call_gemini, mock_genai_model_cls, mock_genai_mode
     result = identify_themes(sample_query_results, theme_count=1)
     
     # Verify call_gemini_api was called
-    mock_call_gemini.assert_called_once()
+    gemini.call_gemini.assert_called_once()
     
     # Verify the result contains themes
     assert len(result) == 1
     assert result[0]["theme_name"] == "Test Theme 1"
     assert result[0]["supporting_documents"] == ["document1.pdf", "document2.pdf"]
 
-@patch('backend.app.services.theme_identification.genai.GenerativeModel')
 @patch('backend.app.services.theme_identification.create_theme_identification_prompt')
-def test_prepare_context(mock_create_prompt, mock_genai_model_cls, mock_genai_model, sample_query_results):
+def test_prepare_context(mock_create_prompt, gemini, sample_query_results):
     """Test the context preparation for the model prompt"""
-    mock_genai_model_cls.return_value = mock_genai_model
     mock_create_prompt.return_value = "Test prompt with query and document content"
     
     # Mock call_gemini_api to return empty list to prevent errors
-    with patch('backend.app.services.theme_identification.call_gemini_api', return_value=[]):
-        # Call identify_themes to trigger create_theme_identification_prompt
-        identify_themes(sample_query_results, theme_count=1)
+    gemini.call_gemini.return_value = []
+    # Call identify_themes to trigger create_theme_identification_prompt
+    identify_themes(sample_query_results, theme_count=1)
     
     # Verify create_theme_identification_prompt was called
     mock_create_prompt.assert_called_once()
@@ -108,12 +122,9 @@ def test_prepare_context(mock_create_prompt, mock_genai_model_cls, mock_genai_mo
     assert args[0][1]["id"] == "document2.pdf"
     assert "policy implementation" in args[0][1]["content"]
 
-@patch('backend.app.services.theme_identification.genai.GenerativeModel')
-@patch('backend.app.services.theme_identification.call_gemini_api')
-def test_generate_themes(mock_call_gemini, mock_genai_model_cls, mock_genai_model):
+def test_generate_themes(gemini):
     """Test the theme generation with the model"""
-    mock_genai_model_cls.return_value = mock_genai_model
-    mock_call_gemini.return_value = [
+    gemini.call_gemini.return_value = [
         {
             "theme_name": "Test Theme 1",
             "summary": "This is a test theme summary.",
@@ -127,42 +138,146 @@ def test_generate_themes(mock_call_gemini, mock_genai_model_cls, mock_genai_mode
     result = identify_themes(sample_data, theme_count=1)
     
     # Verify call_gemini_api was called
-    mock_call_gemini.assert_called_once()
+    gemini.call_gemini.assert_called_once()
     
     # Verify the result structure
     assert len(result) == 1
     assert result[0]["theme_name"] == "Test Theme 1"
 
-@patch('backend.app.services.theme_identification.genai.GenerativeModel')
-@patch('backend.app.services.theme_identification.call_gemini_api')
-def test_identify_themes_empty_results(mock_call_gemini, mock_genai_model_cls, mock_genai_model):
+def test_identify_themes_empty_results(gemini):
     """Test identifying themes with empty results"""
-    mock_genai_model_cls.return_value = mock_genai_model
     
     # Test with empty query results
     result = identify_themes([])
     
     # Verify call_gemini_api wasn't called (short-circuit)
-    mock_call_gemini.assert_not_called()
+    gemini.call_gemini.assert_not_called()
     
     # Verify the result is an empty list
     assert result == []
 
-@patch('backend.app.services.theme_identification.genai.GenerativeModel')
-@patch('backend.app.services.theme_identification.call_gemini_api')
-def test_generate_themes_json_error(mock_call_gemini, mock_genai_model_cls, mock_genai_model):
+def test_generate_themes_json_error(gemini):
     """Test handling JSON parsing errors in theme generation"""
-    mock_genai_model_cls.return_value = mock_genai_model
     
     # Simulate an error in call_gemini_api
-    mock_call_gemini.side_effect = Exception("JSON parsing error")
+    gemini.call_gemini.side_effect = Exception("JSON parsing error")
     
     # Test with minimal sample data
     sample_data = [{"filename": "document1.pdf", "matched_text": "Sample text"}]
     result = identify_themes(sample_data)
     
     # Verify call_gemini_api was called
-    mock_call_gemini.assert_called_once()
+    gemini.call_gemini.assert_called_once()
     
     # Verify the result is an empty list due to error handling
-    assert result == [] 
\ No newline at end of file
+    assert result == [] 
+
+def test_identify_themes_reuses_themes_for_similar_matches(gemini, sample_query_results, monkeypatch):
+    """Test that near-identical matches over the same documents skip Gemini"""
+    from backend.app.services import theme_identification
+    monkeypatch.setattr(theme_identification.settings, "THEME_CACHE_MIN_CHARS", 0)
+    gemini.call_gemini.return_value = [
+        {
+            "theme_name": "Policy",
+            "summary": "Policy summary.",
+            "supporting_documents": ["document1.pdf", "document2.pdf"],
+            "evidence": "Evidence."
+        }
+    ]
+    gemini.embed_matches.side_effect = [
+        normalize_embedding([1.0, 0.0, 0.0]),
+        normalize_embedding([1.0, 0.05, 0.0]),
+        normalize_embedding([1.0, 0.05, 0.0]),
+    ]
+    reworded = [dict(match, matched_text=match["matched_text"] + " Again.") for match in sample_query_results]
+    
+    first = identify_themes(sample_query_results, theme_count=1)
+    assert identify_themes(sample_query_results, theme_count=1) == first
+    assert identify_themes(reworded, theme_count=1) == first
+    assert identify_themes(reworded[:1], theme_count=1)[0]["supporting_documents"] == ["document1.pdf"]
+    
+    # The exact repeat needs no embedding; the single-document set is a different scope
+    assert gemini.embed_matches.call_count == 3
+    assert gemini.call_gemini.call_count == 2
+
+@pytest.mark.parametrize("payload_size,expected_cached", [(50, False), (5000, True)])
+def test_identify_themes_caches_only_large_payloads(gemini, monkeypatch, payload_size, expected_cached):
+    """Test that payloads under THEME_CACHE_MIN_CHARS bypass the theme cache"""
+    from backend.app.services import theme_identification
+    monkeypatch.setattr(theme_identification.settings, "THEME_CACHE_MIN_CHARS", 200)
+    gemini.call_gemini.return_value = [
+        {"theme_name": "Policy", "summary": "Summary.", "supporting_documents": ["document1.pdf"], "evidence": "Evidence."}
+    ]
+    gemini.embed_matches.return_value = normalize_embedding([1.0, 0.0])
+    
+    identify_themes([{"filename": "document1.pdf", "matched_text": "x" * payload_size}], theme_count=1)
+    
+    assert theme_identification.theme_cache.stats()["size"] == int(expected_cached)
+    assert gemini.embed_matches.called is expected_cached
+
+def test_are_themes_similar_returns_bool():
+    """Test that theme similarity compares the Jaccard ratio against the threshold"""
+    from backend.app.services.theme_identification import are_themes_similar
+    
+    assert are_themes_similar("Climate Policy", "climate policy", 0.8) is True
+    assert are_themes_similar("Climate Policy", "Trade Policy", 0.8) is False
+    assert are_themes_similar("", "", 0.5) is False
+
+def test_merge_similar_themes():
+    """Test that near-duplicate theme names are merged and others kept"""
+    from backend.app.services.theme_identification import merge_similar_themes
+    
+    themes = [
+        {"name": "Climate Policy Reform", "relevance": 0.6, "evidence": "a"},
+        {"name": "Trade Agreements", "relevance": 0.7, "evidence": "b"},
+        {"name": "climate policy reform", "relevance": 0.9, "evidence": "c"},
+    ]
+    
+    merged = merge_similar_themes(themes)
+    
+    assert [theme["name"] for theme in merged] == ["Climate Policy Reform", "Trade Agreements"]
+    assert merged[0]["relevance"] == 0.9
+    assert merged[0]["evidence"] == "a\nc"
+    assert themes[0]["evidence"] == "a"
+
+def test_extract_json_array_from_chatty_response():
+    """Test that the first balanced JSON array is sliced out of surrounding text"""
+    from backend.app.services.theme_identification import extract_json_array
+    
+    content = 'Here are the themes: [{"theme_name": "A [draft]", "evidence": "\\"quoted]\\""}] Hope this helps [1].'
+    
+    assert extract_json_array(content) == '[{"theme_name": "A [draft]", "evidence": "\\"quoted]\\""}]'
+    assert extract_json_array("no array here") is None
+    assert extract_json_array("[unterminated") is None
+
+def test_identify_themes_across_documents_bounds_concurrency():
+    """Test that per-document theme extraction is capped by MAX_DOCUMENTS_PER_BATCH"""
+    import asyncio
+    from backend.app.services import theme_identification
+    
+    active = 0
+    peak = 0
+    
+    async def fake_identify(text, max_themes=5, relevance_threshold=0.7):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return [{"name": text, "relevance": 0.9, "evidence": text}]
+    
+    documents = [{"content": f"document {i}"} for i in range(6)]
+    with patch.object(theme_identification.settings, "MAX_DOCUMENTS_PER_BATCH", 2), \
+         patch.object(theme_identification, "identify_themes_in_text", fake_identify):
+        themes = asyncio.run(theme_identification.identify_themes_across_documents(documents, max_themes=10))
+    
+    assert peak == 2
+    assert len(themes) == 6
+
+def test_extract_key_sections_keeps_first_and_longest():
+    """Test that the opening paragraph is kept along with the longest of the rest"""
+    from backend.app.services.theme_identification import extract_key_sections
+    
+    content = "intro\n\nshort\n\na much longer paragraph\n\nmedium one\n\ntiny"
+    
+    assert extract_key_sections(content, max_sections=3) == ["intro", "a much longer paragraph", "medium one"]
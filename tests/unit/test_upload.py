@@ -0,0 +1,13 @@
+import time
+from unittest.mock import patch
+from backend.app.api import upload
+
+def test_schedule_vector_store_rebuild_coalesces_bursts():
+    """Test that several uploads in quick succession trigger one rebuild"""
+    with patch.object(upload, 'rebuild_vector_store_task') as mock_rebuild:
+        for _ in range(5):
+            upload.schedule_vector_store_rebuild(delay=0.05)
+        
+        time.sleep(0.3)
+    
+    mock_rebuild.assert_called_once()